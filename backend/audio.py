@@ -22,8 +22,12 @@ import asyncio
 import os
 from groq import Groq
 from pathlib import Path
+from io import BytesIO
 import sounddevice as sd
 import soundfile as sf
+from single_flight import elevenlabs_tts_flight, request_key
+from scheduler import scheduler, PRIORITY_VOICE
+from metrics import span, timed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,13 +41,24 @@ ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
 if not ELEVENLABS_API_KEY:
     raise ValueError("ELEVENLABS_API_KEY environment variable is not set")
 
-# Initialize ElevenLabs client
+# Neither SDK retries on its own: the scheduler handles 429s and backoff
+NO_SDK_RETRIES = {"max_retries": 0}
+
+# Initialize ElevenLabs client (ELEVENLABS_BASE_URL points it at a local stand-in)
 client = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
+    base_url=os.getenv('ELEVENLABS_BASE_URL'),
 )
 
 # Initialize Groq client
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+
+# Voice activity detection settings shared by record_audio() and SpeechSegmenter
+VAD_MODE = 1                # Less aggressive mode for better speech detection
+VAD_SAMPLE_RATE = 16000     # webrtcvad supports 8000, 16000, 32000 or 48000
+VAD_FRAME_SAMPLES = 320     # 20ms at 16kHz (webrtcvad takes 10, 20 or 30ms frames)
+SILENCE_DURATION = 2.0      # Seconds of silence after speech that end an utterance
+MAX_UTTERANCE_SECONDS = 15  # Same cap as the record_audio() timeout
 
 def speak(text: str) -> None:
     """
@@ -53,7 +68,7 @@ def speak(text: str) -> None:
         text (str): The text to convert to speech
     """
     try:
-        logger.info("Converting text to speech: %s", text)
+        logger.info("Converting %d characters of text to speech", len(text))
         
         # Convert text to speech
         audio = client.text_to_speech.convert(
@@ -77,7 +92,160 @@ def speak(text: str) -> None:
         logger.error("ElevenLabs TTS Error: %s", str(e))
         raise
 
-def record_audio(samplerate=16000, channels=1, chunk=320, silence_duration=2.0):
+def synthesize_speech(text, voice_id="19STyYD15bswVz51nqLf", model_id="eleven_multilingual_v2",
+                      output_format="mp3_44100_128", priority=PRIORITY_VOICE):
+    """
+    Converts text to speech with ElevenLabs and returns the audio bytes.
+
+    Concurrent identical requests share a single upstream call, which waits
+    for admission under the ElevenLabs rate limits.
+
+    Args:
+        text (str): The text to convert to speech
+        voice_id (str): ElevenLabs voice ID
+        model_id (str): ElevenLabs model ID
+        output_format (str): ElevenLabs output format
+        priority (int): Scheduler priority lane
+
+    Returns:
+        bytes: The synthesized audio
+    """
+    def _convert():
+        with span('tts'):
+            audio = client.text_to_speech.convert(
+                text=text,
+                voice_id=voice_id,
+                model_id=model_id,
+                output_format=output_format,
+                request_options=NO_SDK_RETRIES,
+            )
+            # Older SDKs return bytes, newer ones a generator of chunks
+            if isinstance(audio, (bytes, bytearray)):
+                return bytes(audio)
+            return b''.join(audio)
+
+    key = request_key('tts', text, voice_id, model_id, output_format)
+    return elevenlabs_tts_flight.do(
+        key,
+        lambda: scheduler.call('elevenlabs', _convert, priority=priority, tokens=len(text))
+    )
+
+def pcm_to_wav(pcm, samplerate=VAD_SAMPLE_RATE, channels=1):
+    """
+    Wraps raw 16-bit little-endian PCM in a WAV container, in memory.
+
+    Returns:
+      The WAV file contents as bytes.
+    """
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+class SpeechSegmenter:
+    """
+    Streaming version of the VAD logic in record_audio().
+
+    Feed it 16 kHz mono 16-bit PCM in chunks of any size. It reports when
+    speech starts and returns each utterance once it is followed by
+    silence_duration seconds of silence, using the same webrtcvad mode and
+    frame size as record_audio().
+    """
+
+    def __init__(self, samplerate=VAD_SAMPLE_RATE, frame_samples=VAD_FRAME_SAMPLES,
+                 silence_duration=SILENCE_DURATION, min_speech_frames=1, preroll_seconds=0.3,
+                 max_utterance_seconds=MAX_UTTERANCE_SECONDS):
+        self.vad = webrtcvad.Vad(VAD_MODE)
+        self.samplerate = samplerate
+        self.frame_bytes = frame_samples * 2
+        self.silence_threshold = int(silence_duration * samplerate / frame_samples)
+        self.min_speech_frames = min_speech_frames
+        self.max_frames = int(max_utterance_seconds * samplerate / frame_samples)
+        self.preroll = deque(maxlen=max(1, int(preroll_seconds * samplerate / frame_samples)))
+        self.pending = b''
+        self.reset()
+
+    def reset(self):
+        """Forget the current utterance (keeps buffered, unprocessed input)."""
+        self.frames = []
+        self.speech_detected = False
+        self.speech_run = 0
+        self.silence_count = 0
+
+    def is_speech(self, frame):
+        return self.vad.is_speech(frame, self.samplerate)
+
+    def feed(self, pcm):
+        """
+        Process more audio.
+
+        Returns:
+          A list of events: ('speech_start', None) when speech begins and
+          ('utterance', pcm_bytes) when an utterance is complete.
+        """
+        events = []
+        self.pending += pcm
+        offset = 0
+        while len(self.pending) - offset >= self.frame_bytes:
+            frame = self.pending[offset:offset + self.frame_bytes]
+            offset += self.frame_bytes
+            is_speech = self.is_speech(frame)
+
+            if not self.speech_detected:
+                self.preroll.append(frame)
+                self.speech_run = self.speech_run + 1 if is_speech else 0
+                if self.speech_run >= self.min_speech_frames:
+                    self.speech_detected = True
+                    self.frames = list(self.preroll)
+                    self.preroll.clear()
+                    events.append(('speech_start', None))
+                continue
+
+            self.frames.append(frame)
+            self.silence_count = 0 if is_speech else self.silence_count + 1
+            if self.silence_count > self.silence_threshold or len(self.frames) >= self.max_frames:
+                # Drop the trailing silence that ended the utterance
+                voiced = self.frames[:len(self.frames) - self.silence_count]
+                events.append(('utterance', b''.join(voiced)))
+                self.reset()
+        self.pending = self.pending[offset:]
+        return events
+
+def stream_speech(text, voice_id="19STyYD15bswVz51nqLf", model_id="eleven_multilingual_v2",
+                  output_format="mp3_44100_128", priority=PRIORITY_VOICE):
+    """
+    Streams ElevenLabs speech for text as it is synthesized.
+
+    The request is admitted by the scheduler and the first chunk is fetched
+    inside it, so rate limits are retried before any audio is yielded.
+
+    Yields:
+        bytes: Audio chunks
+    """
+    # The streaming method was renamed between SDK versions
+    stream_method = getattr(client.text_to_speech, 'stream', None) or client.text_to_speech.convert_as_stream
+
+    def _open():
+        chunks = iter(stream_method(
+            text=text,
+            voice_id=voice_id,
+            model_id=model_id,
+            output_format=output_format,
+            request_options=NO_SDK_RETRIES,
+        ))
+        return next(chunks, b''), chunks
+
+    with span('tts_first_chunk'):
+        first, chunks = scheduler.call('elevenlabs', _open, priority=priority, tokens=len(text))
+    if first:
+        yield first
+    yield from chunks
+
+@timed('record_audio')
+def record_audio(samplerate=VAD_SAMPLE_RATE, channels=1, chunk=VAD_FRAME_SAMPLES, silence_duration=SILENCE_DURATION):
     """
     Records audio from the microphone and stops when silence is detected.
 
@@ -107,7 +275,7 @@ def record_audio(samplerate=16000, channels=1, chunk=320, silence_duration=2.0):
 
         # Initialize WebRTC VAD
         vad = webrtcvad.Vad()
-        vad.set_mode(1)  # Less aggressive mode for better speech detection
+        vad.set_mode(VAD_MODE)  # Less aggressive mode for better speech detection
 
         frames = []
         silence_count = 0
@@ -115,10 +283,10 @@ def record_audio(samplerate=16000, channels=1, chunk=320, silence_duration=2.0):
         total_frames = 0
         silence_threshold = int(silence_duration * samplerate / chunk)  # Convert silence time to chunks
 
-        logger.info("Listening for speech... (VAD mode 1, silence threshold %.2f sec)", silence_duration)
+        logger.info("Listening for speech... (VAD mode %d, silence threshold %.2f sec)", VAD_MODE, silence_duration)
         
         start_time = time.time()
-        timeout = 15 # seconds
+        timeout = MAX_UTTERANCE_SECONDS
 
         while True:
             if time.time() - start_time > timeout:
@@ -225,6 +393,39 @@ def record_audio(samplerate=16000, channels=1, chunk=320, silence_duration=2.0):
              os.unlink(temp_wav.name)
         return None
 
+@timed('transcribe')
+def transcribe_audio_bytes(audio_bytes, filename="audio.wav", priority=PRIORITY_VOICE):
+    """
+    Transcribes in-memory audio using Groq's Whisper model.
+
+    Parameters:
+      - audio_bytes: The encoded audio (e.g. a 16 kHz mono WAV).
+      - filename: Name sent with the upload; its extension tells Whisper the format.
+      - priority: Scheduler priority lane.
+
+    Returns:
+      The transcribed text, or None if an error occurs.
+    """
+    logger.info(f"Sending {len(audio_bytes)} bytes of audio to Groq Whisper for transcription.")
+    try:
+        transcription = scheduler.call(
+            'groq_audio',
+            lambda: groq_client.audio.transcriptions.create(
+                file=(filename, audio_bytes),
+                model="whisper-large-v3-turbo",  # Using the fastest multilingual model
+                response_format="text",  # Get just the text output
+                language="en",  # Optional: specify language for better accuracy
+                temperature=0.0  # Keep it deterministic
+            ),
+            priority=priority
+        )
+        logger.info("Groq transcription successful (%d characters)", len(transcription or ''))
+        return transcription
+    except Exception as e:
+        logger.error("Groq Transcription Error: %s", str(e))
+        return None
+
+# Timed inside transcribe_audio_bytes
 def transcribe_audio(file_path):
     """
     Transcribes the recorded audio file using Groq's Whisper model.
@@ -242,19 +443,9 @@ def transcribe_audio(file_path):
         logger.info(f"Audio file size: {file_size} bytes")
 
         with open(file_path, "rb") as file:
-            logger.info("Sending audio file to Groq Whisper for transcription.")
-            # Create a transcription using Groq's Whisper model
-            transcription = groq_client.audio.transcriptions.create(
-                file=file,
-                model="whisper-large-v3-turbo",  # Using the fastest multilingual model
-                response_format="text",  # Get just the text output
-                language="en",  # Optional: specify language for better accuracy
-                temperature=0.0  # Keep it deterministic
-            )
-            
-            # The response is already a string when using response_format="text"
-            logger.info("Groq transcription successful. Result: '%s'", transcription)
-            return transcription
+            audio_bytes = file.read()
+        # Same scheduler lane and Whisper call as in-memory audio
+        return transcribe_audio_bytes(audio_bytes, os.path.basename(file_path))
 
     except Exception as e:
         logger.error("Groq Transcription Error: %s", str(e))
@@ -0,0 +1,84 @@
+import io
+import logging
+import av
+import webrtcvad
+
+from audio import VAD_MODE, VAD_SAMPLE_RATE, VAD_FRAME_SAMPLES, pcm_to_wav
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Speech kept on each side of the voiced region when trimming
+TRIM_PADDING_SECONDS = 0.2
+
+class AudioDecodeError(Exception):
+    """Raised when an upload can't be decoded as audio."""
+
+@timed('audio_decode')
+def decode_to_pcm(data, samplerate=VAD_SAMPLE_RATE):
+    """
+    Decode any container/codec PyAV understands (WAV, WebM/Opus, OGG, MP3, ...)
+    to mono 16-bit PCM at the given sample rate, entirely in memory.
+
+    Args:
+        data (bytes): The uploaded file contents
+        samplerate (int): Output sample rate
+
+    Returns:
+        bytes: Raw little-endian PCM
+    """
+    try:
+        with av.open(io.BytesIO(data), mode='r') as container:
+            if not container.streams.audio:
+                raise AudioDecodeError("Upload has no audio stream")
+            stream = container.streams.audio[0]
+            resampler = av.AudioResampler(format='s16', layout='mono', rate=samplerate)
+            pcm = bytearray()
+            for frame in container.decode(stream):
+                for resampled in resampler.resample(frame):
+                    pcm += resampled.to_ndarray().tobytes()
+            for resampled in resampler.resample(None):
+                pcm += resampled.to_ndarray().tobytes()
+            return bytes(pcm)
+    except av.error.FFmpegError as e:
+        raise AudioDecodeError(f"Could not decode audio: {str(e)}") from e
+
+def trim_silence(pcm, samplerate=VAD_SAMPLE_RATE, frame_samples=VAD_FRAME_SAMPLES,
+                 padding_seconds=TRIM_PADDING_SECONDS):
+    """
+    Cut leading and trailing silence using the same webrtcvad settings as
+    audio.record_audio().
+
+    Returns:
+        bytes: The trimmed PCM, or b'' if no speech was detected
+    """
+    vad = webrtcvad.Vad(VAD_MODE)
+    frame_bytes = frame_samples * 2
+    frame_count = len(pcm) // frame_bytes
+    voiced = [i for i in range(frame_count)
+              if vad.is_speech(pcm[i * frame_bytes:(i + 1) * frame_bytes], samplerate)]
+    if not voiced:
+        return b''
+    padding = int(padding_seconds * samplerate / frame_samples)
+    start = max(0, voiced[0] - padding) * frame_bytes
+    end = min(frame_count, voiced[-1] + 1 + padding) * frame_bytes
+    return pcm[start:end]
+
+def prepare_for_transcription(data):
+    """
+    Turn an uploaded clip into the smallest WAV Whisper needs: 16 kHz mono
+    with the silence at both ends removed.
+
+    Args:
+        data (bytes): The uploaded file contents (any supported format)
+
+    Returns:
+        bytes: WAV contents, or None if the clip contains no speech
+    """
+    pcm = decode_to_pcm(data)
+    trimmed = trim_silence(pcm)
+    logger.info(f"Audio ingest: {len(data)} bytes uploaded, {len(pcm)} bytes PCM, "
+                f"{len(trimmed)} bytes after trimming silence")
+    if not trimmed:
+        return None
+    return pcm_to_wav(trimmed)
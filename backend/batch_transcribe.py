@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import webrtcvad
+
+from audio import VAD_MODE, VAD_SAMPLE_RATE, VAD_FRAME_SAMPLES, pcm_to_wav, transcribe_audio_bytes
+from audio_ingest import AudioDecodeError, decode_to_pcm
+from metrics import span
+from scheduler import PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Segmenting
+TARGET_SEGMENT_SECONDS = 30   # Start looking for a pause once a segment is this long
+MAX_SEGMENT_SECONDS = 60      # Hard cut if no pause is found (well under Whisper's upload limit)
+MIN_PAUSE_SECONDS = 0.3       # Silence long enough to cut at
+
+# Concurrency
+MAX_PARALLEL_SEGMENTS = int(os.getenv("BATCH_PARALLEL_SEGMENTS", "4"))  # Segments transcribed at once, across all jobs
+MAX_RUNNING_JOBS = int(os.getenv("BATCH_MAX_JOBS", "4"))                # Jobs decoding or waiting on segments at once
+JOB_TTL = 60 * 60             # Seconds finished jobs are kept for polling
+
+# Shared by every job so concurrent jobs can't multiply the number of upstream calls
+_segment_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS, thread_name_prefix='transcribe')
+
+class BatchBusy(Exception):
+    """Raised when MAX_RUNNING_JOBS batch jobs are already running."""
+
+def split_at_pauses(pcm, samplerate=VAD_SAMPLE_RATE, frame_samples=VAD_FRAME_SAMPLES,
+                    target_seconds=TARGET_SEGMENT_SECONDS, max_seconds=MAX_SEGMENT_SECONDS,
+                    min_pause_seconds=MIN_PAUSE_SECONDS):
+    """
+    Split long PCM into segments at pauses detected with webrtcvad.
+
+    Once a segment reaches target_seconds it is cut in the middle of the
+    next pause of at least min_pause_seconds; with no pause it is cut at
+    max_seconds. Segments with no speech at all are dropped.
+
+    Args:
+        pcm (bytes): 16-bit mono PCM
+
+    Returns:
+        list: (start_seconds, end_seconds, pcm_bytes) tuples in order
+    """
+    vad = webrtcvad.Vad(VAD_MODE)
+    frame_bytes = frame_samples * 2
+    frame_seconds = frame_samples / samplerate
+    frame_count = len(pcm) // frame_bytes
+    target_frames = int(target_seconds / frame_seconds)
+    max_frames = int(max_seconds / frame_seconds)
+    pause_frames = max(1, int(min_pause_seconds / frame_seconds))
+
+    segments = []
+    start = 0
+    silence_run = 0
+    has_speech = False
+
+    def close(end):
+        if has_speech and end > start:
+            segments.append((start * frame_seconds, end * frame_seconds,
+                             pcm[start * frame_bytes:end * frame_bytes]))
+
+    for i in range(frame_count):
+        is_speech = vad.is_speech(pcm[i * frame_bytes:(i + 1) * frame_bytes], samplerate)
+        has_speech = has_speech or is_speech
+        silence_run = 0 if is_speech else silence_run + 1
+        length = i + 1 - start
+        if length >= target_frames and silence_run >= pause_frames:
+            # Cut in the middle of the pause so no word is clipped
+            cut = i + 1 - silence_run // 2
+            close(cut)
+            start, has_speech, silence_run = cut, False, 0
+        elif length >= max_frames:
+            close(i + 1)
+            start, has_speech, silence_run = i + 1, False, 0
+    close(frame_count)
+    return segments
+
+def _transcribe_segment(segment):
+    start, end, pcm = segment
+    with span('batch_segment'):
+        text = transcribe_audio_bytes(pcm_to_wav(pcm), priority=PRIORITY_BACKGROUND)
+    return {'start': round(start, 2), 'end': round(end, 2), 'text': (text or '').strip(), 'ok': text is not None}
+
+def transcribe_files(files, pool=None):
+    """
+    Transcribe several recordings, splitting each at pauses and running all
+    segments through one bounded pool so throughput scales with concurrency
+    rather than with clip length.
+
+    Args:
+        files (list): (filename, bytes) tuples in any format PyAV can decode
+        pool (Executor): Runs the segments; defaults to the pool shared by all jobs
+
+    Returns:
+        list: Per-file dicts with text, timestamped segments and any error, in input order
+    """
+    results = []
+    work = []
+    for name, data in files:
+        result = {'filename': name, 'text': '', 'segments': [], 'duration': 0.0, 'error': None}
+        results.append(result)
+        try:
+            pcm = decode_to_pcm(data)
+        except AudioDecodeError as e:
+            result['error'] = str(e)
+            continue
+        result['duration'] = round(len(pcm) / 2 / VAD_SAMPLE_RATE, 2)
+        segments = split_at_pauses(pcm)
+        logger.info(f"Split {result['duration']}s of audio into {len(segments)} segments")
+        work.extend((result, segment) for segment in segments)
+
+    pool = pool or _segment_pool
+    transcribed = list(pool.map(lambda item: _transcribe_segment(item[1]), work))
+
+    # pool.map preserves order, so segments come back in file and time order
+    for (result, _), segment in zip(work, transcribed):
+        result['segments'].append(segment)
+    for result in results:
+        failed = [s for s in result['segments'] if not s.pop('ok')]
+        if failed and result['error'] is None:
+            result['error'] = f"{len(failed)} of {len(result['segments'])} segments failed to transcribe"
+        result['text'] = ' '.join(s['text'] for s in result['segments'] if s['text'])
+    return results
+
+class BatchJobs:
+    """In-memory registry of background batch transcription jobs."""
+
+    def __init__(self, ttl=JOB_TTL, max_running=MAX_RUNNING_JOBS):
+        self.ttl = ttl
+        self.max_running = max_running
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._runner = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix='batch')
+
+    def submit(self, files):
+        """
+        Start transcribing files in the background and return the job ID.
+
+        Raises:
+            BatchBusy: max_running jobs are already running
+        """
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'running', 'files': len(files), 'created': time.time(),
+               'finished': None, 'results': None, 'error': None}
+        with self._lock:
+            self._expire()
+            running = sum(1 for j in self._jobs.values() if j['finished'] is None)
+            if running >= self.max_running:
+                raise BatchBusy(f"{running} batch jobs are already running, try again later")
+            self._jobs[job_id] = job
+        self._runner.submit(self._run, job, files)
+        return job_id
+
+    def _run(self, job, files):
+        try:
+            results = transcribe_files(files)
+            job.update(status='done', results=results)
+        except Exception as e:
+            logger.error(f"Batch transcription job {job['id']} failed: {str(e)}", exc_info=True)
+            job.update(status='failed', error='Batch transcription failed')
+        finally:
+            job['finished'] = time.time()
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items() if job['finished'] and now - job['finished'] > self.ttl]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return the job dict, or None if unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+# Shared registry used by the Flask endpoints
+batch_jobs = BatchJobs()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Benchmarks import backend modules flat, as main.py does; the repo root is
+# on the path too so `python -m backend.benchmarks...` works from there
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+for path in (BACKEND_DIR, ROOT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
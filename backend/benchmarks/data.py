@@ -0,0 +1,148 @@
+import io
+import math
+import random
+import struct
+import wave
+
+MEDICATIONS = [
+    ("Lisinopril", "10mg", "once daily for blood pressure"),
+    ("Metformin", "500mg", "twice daily with meals for type 2 diabetes"),
+    ("Atorvastatin", "20mg", "once daily at bedtime for cholesterol"),
+    ("Aspirin", "81mg", "once daily for heart health"),
+    ("Levothyroxine", "50mcg", "once daily before breakfast"),
+    ("Amlodipine", "5mg", "once daily for blood pressure"),
+]
+LABS = [
+    ("Blood Pressure", "mmHg", lambda: f"{random.randint(110, 150)}/{random.randint(70, 95)}"),
+    ("A1C", "%", lambda: f"{random.uniform(5.5, 8.5):.1f}"),
+    ("LDL Cholesterol", "mg/dL", lambda: str(random.randint(70, 180))),
+    ("HDL Cholesterol", "mg/dL", lambda: str(random.randint(35, 70))),
+    ("Triglycerides", "mg/dL", lambda: str(random.randint(90, 250))),
+]
+EVENTS = [
+    "Annual Physical appointment with Dr. Smith",
+    "Diabetes follow-up visit with Dr. Johnson",
+    "Blood work at City Lab",
+    "Prescription refill for Metformin",
+    "MRI scan of lower back",
+]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+def _random_date():
+    year, month, day = random.randint(2018, 2025), random.randint(1, 12), random.randint(1, 28)
+    style = random.randrange(3)
+    if style == 0:
+        return f"{month:02d}/{day:02d}/{year}"
+    if style == 1:
+        return f"{MONTHS[month - 1]} {day}, {year}"
+    return f"{year}-{month:02d}-{day:02d}"
+
+def make_record_lines(count, seed=0):
+    """
+    Generate synthetic medical record lines with dates, medications and labs.
+
+    Args:
+        count (int): Number of lines to generate
+        seed (int): Random seed so runs are comparable
+
+    Returns:
+        list: Lines of record text
+    """
+    random.seed(seed)
+    lines = ["PATIENT MEDICAL RECORD", "Name: Test Patient", "Patient ID: P00000"]
+    while len(lines) < count:
+        kind = random.randrange(4)
+        if kind == 0:
+            name, dose, how = random.choice(MEDICATIONS)
+            lines.append(f"{name} {dose} - Take {how}")
+        elif kind == 1:
+            name, unit, value = random.choice(LABS)
+            lines.append(f"{name}: {value()} {unit} ({_random_date()})")
+        elif kind == 2:
+            lines.append(f"{random.choice(EVENTS)} - {_random_date()} at 10:00 AM")
+        else:
+            lines.append("Patient reports feeling well; continue current plan and monitor diet and exercise.")
+    return lines[:count]
+
+def make_record_text(count, seed=0):
+    """Generate synthetic record text of the given number of lines."""
+    return '\n'.join(make_record_lines(count, seed))
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def make_pdf(pages, lines_per_page=50, seed=0):
+    """
+    Build a text PDF in memory without any PDF library.
+
+    Args:
+        pages (int): Number of pages
+        lines_per_page (int): Record lines per page
+        seed (int): Random seed for the record text
+
+    Returns:
+        bytes: The PDF file contents
+    """
+    lines = make_record_lines(pages * lines_per_page, seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for p in range(pages):
+        chunk = lines[p * lines_per_page:(p + 1) * lines_per_page]
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in chunk:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = '\n'.join(ops).encode('latin-1', 'replace')
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    kids = b' '.join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+              % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+def make_wav(seconds=2.0, samplerate=16000, channels=1, frequency=220.0):
+    """
+    Build a WAV clip (a tone with short pauses) in memory.
+
+    Returns:
+        bytes: The WAV file contents
+    """
+    frames = bytearray()
+    total = int(seconds * samplerate)
+    for i in range(total):
+        # Half a second of tone followed by a quarter second of silence
+        audible = (i % int(0.75 * samplerate)) < int(0.5 * samplerate)
+        value = int(8000 * math.sin(2 * math.pi * frequency * i / samplerate)) if audible else 0
+        frames += struct.pack('<h', value) * channels
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(bytes(frames))
+    return out.getvalue()
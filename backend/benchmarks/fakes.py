@@ -0,0 +1,288 @@
+"""
+Local stand-ins for the Groq, ElevenLabs and Pinecone HTTP APIs.
+
+One threaded HTTP server answers all three providers' routes with canned
+responses after a configurable latency, so the backend can be benchmarked
+on a machine with no network access. Point the SDK clients at it with
+point_clients_at() before importing the backend modules.
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+@dataclass
+class FakeConfig:
+    """Latencies (seconds) and payload sizes for the fake upstreams."""
+    chat_latency: float = 0.3          # Time to first token
+    token_delay: float = 0.01          # Per streamed token
+    completion_tokens: int = 60
+    transcription_latency: float = 0.4
+    embedding_latency: float = 0.05
+    embedding_dim: int = 4096
+    tts_latency: float = 0.25
+    tts_bytes: int = 32000
+    tts_chunk_delay: float = 0.02      # Per streamed audio chunk
+    pinecone_latency: float = 0.02
+    vectors: dict = field(default_factory=dict)
+
+_WORDS = ("Your records show steady progress and your current medications "
+          "look appropriate, keep following your care plan and talk to your doctor").split()
+
+def _completion_text(tokens):
+    return ' '.join(_WORDS[i % len(_WORDS)] for i in range(tokens))
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "DehaFakeUpstream/1.0"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type, chunks, delay):
+        # HTTP/1.0: no Content-Length, the connection closes at the end
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        for chunk in chunks:
+            time.sleep(delay)
+            self.wfile.write(chunk)
+            self.wfile.flush()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/indexes':
+            return self._json({'indexes': [self._index_description('medical-records')]})
+        if path.startswith('/indexes/'):
+            return self._json(self._index_description(path.rsplit('/', 1)[-1]))
+        if path == '/describe_index_stats':
+            return self._pinecone_stats()
+        self._json({'error': f'unknown route {path}'}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path.endswith('/chat/completions'):
+            return self._chat(json.loads(body or b'{}'))
+        if path.endswith('/audio/transcriptions'):
+            time.sleep(self.config.transcription_latency)
+            # Not a fact-table question shape, so /voice load reaches the completion path
+            return self._text("Can you explain what my latest lab results mean for my health?")
+        if path.endswith('/embeddings'):
+            return self._embeddings(json.loads(body or b'{}'))
+        if path.startswith('/v1/text-to-speech/'):
+            return self._tts(path.endswith('/stream'))
+        if path == '/indexes':
+            return self._json(self._index_description(json.loads(body)['name']), 201)
+        if path == '/vectors/upsert':
+            return self._pinecone_upsert(json.loads(body))
+        if path == '/query':
+            return self._pinecone_query(json.loads(body))
+        if path == '/vectors/delete':
+            return self._pinecone_delete(json.loads(body))
+        if path == '/describe_index_stats':
+            return self._pinecone_stats()
+        self._json({'error': f'unknown route {path}'}, 404)
+
+    def _text(self, text):
+        data = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Groq (OpenAI-compatible)
+
+    def _chat(self, payload):
+        cfg = self.config
+        tokens = min(cfg.completion_tokens, payload.get('max_tokens') or cfg.completion_tokens)
+        prompt_tokens = sum(len(m.get('content') or '') for m in payload.get('messages', [])) // 4
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = payload.get('model', 'fake')
+        time.sleep(cfg.chat_latency)
+
+        if payload.get('stream'):
+            def events():
+                for i in range(tokens):
+                    delta = {'content': ('' if i == 0 else ' ') + _WORDS[i % len(_WORDS)]}
+                    chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                             'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n".encode('utf-8')
+                yield b"data: [DONE]\n\n"
+            return self._stream('text/event-stream', events(), cfg.token_delay)
+
+        time.sleep(cfg.token_delay * tokens)
+        self._json({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': _completion_text(tokens)}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': tokens,
+                      'total_tokens': prompt_tokens + tokens},
+        })
+
+    def _embeddings(self, payload):
+        cfg = self.config
+        time.sleep(cfg.embedding_latency)
+        inputs = payload.get('input')
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            seed = sum(map(ord, str(text))) or 1
+            data.append({'object': 'embedding', 'index': i,
+                         'embedding': [math.sin(seed * (j + 1)) for j in range(cfg.embedding_dim)]})
+        self._json({'object': 'list', 'data': data, 'model': payload.get('model', 'fake'),
+                    'usage': {'prompt_tokens': 0, 'total_tokens': 0}})
+
+    # ElevenLabs
+
+    def _tts(self, stream):
+        cfg = self.config
+        time.sleep(cfg.tts_latency)
+        audio = b'\xff\xf3' + b'\x00' * (cfg.tts_bytes - 2)
+        if stream:
+            chunk = 4096
+            return self._stream('audio/mpeg', (audio[i:i + chunk] for i in range(0, len(audio), chunk)),
+                                cfg.tts_chunk_delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(audio)))
+        self.end_headers()
+        self.wfile.write(audio)
+
+    # Pinecone (control plane and data plane on the same server)
+
+    def _index_description(self, name):
+        host, port = self.server.server_address[:2]
+        return {'name': name, 'dimension': self.config.embedding_dim, 'metric': 'cosine',
+                'host': f"http://{host}:{port}", 'spec': {'serverless': {'cloud': 'aws', 'region': 'us-west-2'}},
+                'status': {'ready': True, 'state': 'Ready'}}
+
+    def _namespace(self, name):
+        with self.server.lock:
+            return self.config.vectors.setdefault(name or '', {})
+
+    def _pinecone_upsert(self, payload):
+        time.sleep(self.config.pinecone_latency)
+        namespace = self._namespace(payload.get('namespace'))
+        with self.server.lock:
+            for vector in payload.get('vectors', []):
+                namespace[vector['id']] = (vector.get('values') or [], vector.get('metadata') or {})
+        self._json({'upsertedCount': len(payload.get('vectors', []))})
+
+    def _pinecone_query(self, payload):
+        time.sleep(self.config.pinecone_latency)
+        query = payload.get('vector') or []
+        wanted = payload.get('filter') or {}
+        query_norm = math.sqrt(sum(v * v for v in query)) or 1.0
+        matches = []
+        with self.server.lock:
+            items = list(self._namespace(payload.get('namespace')).items())
+        for vector_id, (values, metadata) in items:
+            if any(metadata.get(k) != (v.get('$eq') if isinstance(v, dict) else v) for k, v in wanted.items()):
+                continue
+            norm = math.sqrt(sum(v * v for v in values)) or 1.0
+            score = sum(a * b for a, b in zip(query, values)) / (norm * query_norm)
+            matches.append({'id': vector_id, 'score': score,
+                            'metadata': metadata if payload.get('includeMetadata', True) else None})
+        matches.sort(key=lambda m: m['score'], reverse=True)
+        self._json({'matches': matches[:payload.get('topK', 10)], 'namespace': payload.get('namespace', '')})
+
+    def _pinecone_delete(self, payload):
+        time.sleep(self.config.pinecone_latency)
+        name = payload.get('namespace') or ''
+        with self.server.lock:
+            if payload.get('deleteAll'):
+                self.config.vectors.pop(name, None)
+            else:
+                namespace = self.config.vectors.get(name, {})
+                for vector_id in payload.get('ids', []):
+                    namespace.pop(vector_id, None)
+        self._json({})
+
+    def _pinecone_stats(self):
+        with self.server.lock:
+            namespaces = {name: {'vectorCount': len(v)} for name, v in self.config.vectors.items()}
+        self._json({'namespaces': namespaces, 'dimension': self.config.embedding_dim,
+                    'totalVectorCount': sum(n['vectorCount'] for n in namespaces.values())})
+
+def start_fake_upstreams(host='127.0.0.1', port=0, config=None):
+    """
+    Start the fake upstream server on a background thread.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free one
+        config (FakeConfig): Latency settings, defaults to FakeConfig()
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.config = config or FakeConfig()
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, name='fake-upstreams', daemon=True)
+    thread.start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}"
+
+def point_clients_at(base_url):
+    """
+    Point the Groq, ElevenLabs and Pinecone clients at the fake server.
+
+    Must run before the backend modules are imported, since they create
+    their clients at import time.
+    """
+    os.environ['GROQ_BASE_URL'] = base_url
+    os.environ['ELEVENLABS_BASE_URL'] = base_url
+    os.environ['PINECONE_CONTROLLER_HOST'] = base_url
+    for key in ('GROQ_API_KEY', 'ELEVENLABS_API_KEY', 'PINECONE_API_KEY'):
+        os.environ.setdefault(key, 'offline-benchmark')
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Groq/ElevenLabs/Pinecone upstreams")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--chat-latency', type=float, default=FakeConfig.chat_latency)
+    parser.add_argument('--token-delay', type=float, default=FakeConfig.token_delay)
+    parser.add_argument('--transcription-latency', type=float, default=FakeConfig.transcription_latency)
+    parser.add_argument('--tts-latency', type=float, default=FakeConfig.tts_latency)
+    args = parser.parse_args()
+
+    config = FakeConfig(chat_latency=args.chat_latency, token_delay=args.token_delay,
+                        transcription_latency=args.transcription_latency, tts_latency=args.tts_latency)
+    server, base_url = start_fake_upstreams(args.host, args.port, config)
+    print(f"Fake upstreams listening on {base_url}")
+    print(f"  export GROQ_BASE_URL={base_url} ELEVENLABS_BASE_URL={base_url} PINECONE_CONTROLLER_HOST={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Concurrent load generator for the /chat, /voice, /upload and /tts endpoints.
+
+Against a running server:
+
+    python -m benchmarks.load --url http://127.0.0.1:5000 --concurrency 16 --requests 400
+
+Fully offline (fake upstreams + the Flask app in-process):
+
+    python -m benchmarks.load --offline --chat-latency 0.3 --tts-latency 0.2
+
+Reports p50/p95/p99 latency and throughput per endpoint. "chat" sends
+questions that need a completion; "facts" sends ones the fact table answers
+without one, so both paths are measured separately.
+"""
+import argparse
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks import data
+from benchmarks.fakes import FakeConfig, point_clients_at, start_fake_upstreams
+from benchmarks.stats import print_table, summarize
+
+# Need the LLM: none of these match a fact-table question shape
+QUESTIONS = [
+    "Should I change my diet given my blood pressure?",
+    "How has my A1C changed over the last few years?",
+    "Can you explain what my cholesterol results mean?",
+    "What should I ask my doctor at my next appointment?",
+]
+# Answered straight from the fact table
+FACT_QUESTIONS = [
+    "What medications am I on?",
+    "What were my last lab results?",
+    "When is my next appointment?",
+    "What are my allergies?",
+]
+
+class Payloads:
+    """Request bodies built once up front so generation cost isn't measured."""
+
+    def __init__(self, pdf_pages):
+        self.pdf = data.make_pdf(pdf_pages)
+        self.wav = data.make_wav(seconds=3.0)
+        self.questions = itertools.cycle(QUESTIONS)
+        self.fact_questions = itertools.cycle(FACT_QUESTIONS)
+        self.lock = threading.Lock()
+
+    def question(self):
+        with self.lock:
+            return next(self.questions)
+
+    def fact_question(self):
+        with self.lock:
+            return next(self.fact_questions)
+
+def _chat(session, url, payloads):
+    return session.post(f"{url}/chat", json={'message': payloads.question()})
+
+def _facts(session, url, payloads):
+    return session.post(f"{url}/chat", json={'message': payloads.fact_question()})
+
+def _voice(session, url, payloads):
+    return session.post(f"{url}/voice", files={'audio_file': ('clip.wav', payloads.wav, 'audio/wav')})
+
+def _upload(session, url, payloads):
+    return session.post(f"{url}/upload", files={'file': ('record.pdf', payloads.pdf, 'application/pdf')})
+
+def _tts(session, url, payloads):
+    return session.post(f"{url}/tts", json={'text': payloads.question()})
+
+SCENARIOS = {'chat': _chat, 'facts': _facts, 'voice': _voice, 'upload': _upload, 'tts': _tts}
+
+# /chat and /voice report some failures with a 200 and an apology instead of an error status
+ERROR_REPLY = "Sorry, I encountered an error"
+
+def _succeeded(response):
+    if response.status_code >= 400:
+        return False
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        body = response.json()
+        if isinstance(body, dict):
+            return 'error' not in body and not str(body.get('response', '')).startswith(ERROR_REPLY)
+    return True
+
+def run_load(url, endpoints, concurrency, total, payloads):
+    """
+    Send total requests round-robin over endpoints with the given concurrency.
+
+    Returns:
+        dict: {endpoint: summary} plus an 'all' row
+    """
+    latencies = {name: [] for name in endpoints}
+    errors = {name: 0 for name in endpoints}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(name):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = SCENARIOS[name](session, url, payloads)
+            response.content  # Include the full download
+            ok = _succeeded(response)
+        except (requests.RequestException, ValueError):
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies[name].append(elapsed)
+            else:
+                errors[name] += 1
+
+    order = [endpoints[i % len(endpoints)] for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, order))
+    wall = time.perf_counter() - start
+
+    rows = {name: summarize(latencies[name], wall, errors[name]) for name in endpoints}
+    rows['all'] = summarize(list(itertools.chain(*latencies.values())), wall, sum(errors.values()))
+    return rows
+
+def start_offline_app(config):
+    """Start fake upstreams and serve the backend app in-process; return its URL."""
+    from werkzeug.serving import make_server
+
+    _, upstream_url = start_fake_upstreams(config=config)
+    point_clients_at(upstream_url)
+    # Lift the scheduler quotas (read at import) so the run measures the app, not the throttle
+    for name in ('GROQ_RPM', 'GROQ_TPM', 'GROQ_AUDIO_RPM', 'ELEVENLABS_RPM', 'PINECONE_RPM'):
+        os.environ[name] = '100000000'
+    from main import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='deha-app', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Deha AI load generator")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--offline', action='store_true', help="Run the app in-process against fake upstreams")
+    parser.add_argument('--endpoints', default='chat,facts,voice,upload,tts')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--pdf-pages', type=int, default=20)
+    parser.add_argument('--chat-latency', type=float, default=FakeConfig.chat_latency)
+    parser.add_argument('--token-delay', type=float, default=FakeConfig.token_delay)
+    parser.add_argument('--transcription-latency', type=float, default=FakeConfig.transcription_latency)
+    parser.add_argument('--tts-latency', type=float, default=FakeConfig.tts_latency)
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = set(endpoints) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    url = args.url
+    if args.offline:
+        url = start_offline_app(FakeConfig(chat_latency=args.chat_latency, token_delay=args.token_delay,
+                                           transcription_latency=args.transcription_latency,
+                                           tts_latency=args.tts_latency))
+
+    payloads = Payloads(args.pdf_pages)
+    # Chat and voice need a record loaded first
+    _upload(requests.Session(), url, payloads).raise_for_status()
+
+    rows = run_load(url, endpoints, args.concurrency, args.requests, payloads)
+    print_table(rows, title=f"Load: {args.requests} requests, concurrency {args.concurrency}, {url}")
+
+if __name__ == "__main__":
+    main()
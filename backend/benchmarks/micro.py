@@ -0,0 +1,60 @@
+"""
+Microbenchmarks for the CPU-bound ingestion helpers.
+
+    python -m benchmarks.micro --lines 20000 --pages 200
+
+Runs offline; no upstream is contacted.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import data
+from benchmarks.fakes import point_clients_at
+from benchmarks.stats import print_table, summarize
+
+def bench(fn, *args, repeat=5):
+    """Call fn(*args) repeat times and return a latency summary."""
+    fn(*args)  # Warm-up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Deha AI ingestion microbenchmarks")
+    parser.add_argument('--lines', type=int, default=20000, help="Record lines for text benchmarks")
+    parser.add_argument('--pages', type=int, default=200, help="Pages in the generated PDF")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # rag creates its clients at import time; make sure they never reach the network
+    point_clients_at('http://127.0.0.1:9')
+    from rag import chunk_text
+    from calendar_utils import extract_calendar_events
+    from fact_table import extract_facts
+    from pdf_loader import load_pdf_text
+
+    text = data.make_record_text(args.lines)
+    pdf_bytes = data.make_pdf(args.pages)
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(pdf_bytes)
+        pdf_path = f.name
+
+    try:
+        rows = {
+            f"chunk_text ({len(text) // 1024} KiB)": bench(chunk_text, text, repeat=args.repeat),
+            f"extract_calendar_events ({args.lines} lines)": bench(extract_calendar_events, text, repeat=args.repeat),
+            f"extract_facts ({args.lines} lines)": bench(extract_facts, text, repeat=args.repeat),
+            f"load_pdf_text ({args.pages} pages, {len(pdf_bytes) // 1024} KiB)": bench(load_pdf_text, pdf_path, repeat=args.repeat),
+        }
+    finally:
+        os.unlink(pdf_path)
+
+    print_table(rows, title="Microbenchmarks")
+
+if __name__ == "__main__":
+    main()
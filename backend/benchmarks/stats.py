@@ -0,0 +1,46 @@
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(latencies, elapsed=None, errors=0):
+    """
+    Summarize latencies (seconds) as count, p50/p95/p99 in ms and throughput.
+
+    Args:
+        latencies (list): Successful request latencies in seconds
+        elapsed (float): Wall-clock duration of the run, for throughput
+        errors (int): Failed request count
+
+    Returns:
+        dict: The summary
+    """
+    summary = {
+        'count': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+    if elapsed:
+        summary['throughput_rps'] = len(latencies) / elapsed
+    return summary
+
+def print_table(rows, title=None):
+    """Print {name: summary} rows as an aligned table."""
+    if title:
+        print(f"\n{title}")
+    columns = ['count', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'throughput_rps']
+    present = [c for c in columns if any(c in row for row in rows.values())]
+    name_width = max([len(name) for name in rows] + [8])
+    print(f"{'name':<{name_width}}  " + '  '.join(f"{c:>14}" for c in present))
+    for name, row in rows.items():
+        cells = []
+        for c in present:
+            value = row.get(c, '')
+            cells.append(f"{value:>14.2f}" if isinstance(value, float) else f"{value:>14}")
+        print(f"{name:<{name_width}}  " + '  '.join(cells))
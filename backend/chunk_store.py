@@ -0,0 +1,103 @@
+import hashlib
+import mmap
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Patient data lives outside the repository, which the web server serves static files from
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.expanduser("~"), ".deha", "rag"))
+CHUNK_STORE_DIR = os.getenv("RAG_CHUNK_STORE", os.path.join(DATA_DIR, "chunk_store"))
+
+_WORD = re.compile(rb'\S+')
+
+def document_id(patient_id, data):
+    """Stable ID for one version of a patient's document: safe patient ID plus a content hash."""
+    safe_patient = re.sub(r'[^A-Za-z0-9_-]', '_', str(patient_id))
+    return f"{safe_patient}-{hashlib.sha256(data).hexdigest()[:12]}"
+
+def chunk_spans(data, chunk_size):
+    """
+    Byte ranges of chunks in UTF-8 text, using the same word-count rule as
+    rag.chunk_text() but without copying any text.
+
+    Args:
+        data (bytes): The document as UTF-8
+        chunk_size (int): Target chunk size in characters
+
+    Returns:
+        list: (start, end) byte offsets into data
+    """
+    spans = []
+    start = None
+    end = 0
+    current_size = 0
+    for match in _WORD.finditer(data):
+        if start is None:
+            start = match.start()
+        end = match.end()
+        current_size += len(match.group()) + 1  # +1 for space
+        if current_size >= chunk_size:
+            spans.append((start, end))
+            start = None
+            current_size = 0
+    if start is not None:
+        spans.append((start, end))
+    return spans
+
+class ChunkStore:
+    """
+    Document text stored once per document, read back by (doc_id, start, end).
+
+    Each document is one UTF-8 file; reads go through a shared read-only
+    mmap, so vector metadata only needs byte offsets instead of a copy of
+    every chunk's text.
+    """
+
+    def __init__(self, directory=CHUNK_STORE_DIR):
+        self.directory = directory
+        self._maps = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, doc_id):
+        return os.path.join(self.directory, f"{doc_id}.txt")
+
+    def put(self, doc_id, data):
+        """Store a document's UTF-8 bytes (replacing any previous version)."""
+        tmp_path = self._path(doc_id) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            # Never close a cached map here: a concurrent read() may be slicing it.
+            # Dropping the reference unmaps it once the last reader is done, and the
+            # old mapping stays valid because os.replace() leaves the old inode alone.
+            self._maps.pop(doc_id, None)
+            os.replace(tmp_path, self._path(doc_id))
+
+    def _map(self, doc_id):
+        with self._lock:
+            mapped = self._maps.get(doc_id)
+            if mapped is None:
+                with open(self._path(doc_id), 'rb') as f:
+                    # mmap can't map empty files
+                    if os.fstat(f.fileno()).st_size == 0:
+                        return b''
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[doc_id] = mapped
+            return mapped
+
+    def read(self, doc_id, start, end):
+        """Return the text between two byte offsets of a stored document."""
+        return self._map(doc_id)[start:end].decode('utf-8', errors='replace')
+
+    def delete(self, doc_id):
+        with self._lock:
+            # As in put(), let the map be unmapped when readers release it
+            self._maps.pop(doc_id, None)
+        try:
+            os.unlink(self._path(doc_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,350 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+import logging
+
+from calendar_utils import extract_calendar_events
+from metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+MAX_FACT_TABLES = 64
+
+# Section headings ("Current Medications:", "Recent Lab Results (2024-02-15):", ...) by keyword.
+# Checked in order, so "Family History" is skipped before "History" counts as diagnoses.
+SECTION_KEYWORDS = [
+    (None, ['family', 'lifestyle', 'social', 'instruction', 'changes']),
+    ('medications', ['medication', 'prescription', 'meds']),
+    ('labs', ['lab', 'result', 'vital']),
+    ('allergies', ['allerg']),
+    ('appointments', ['appointment', 'visit', 'schedule']),
+    ('diagnoses', ['diagnos', 'history', 'condition', 'problem']),
+]
+
+BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*')
+MEDICATION = re.compile(
+    r'^(?P<name>[A-Za-z][A-Za-z0-9 /-]*?)\s+'
+    r'(?P<dose>\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|units?|iu)\b)'
+    r'\s*(?:[-–—:,]\s*)?(?P<instructions>.*)$', re.IGNORECASE)
+LAB_ITEM = re.compile(
+    r'^(?P<name>[A-Za-z][A-Za-z0-9 ()/-]*?)\s*:\s*'
+    r'(?P<value>\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?)\s*(?P<unit>%|[A-Za-z]+(?:/[A-Za-z]+)?)?')
+# Known labs mentioned anywhere in the record, e.g. "LDL 110 mg/dL on 2023-08-01"
+LAB_MENTION = re.compile(
+    r'\b(?P<name>(?:ldl|hdl|total) cholesterol|ldl|hdl|cholesterol|triglycerides|hba1c|a1c|glucose|blood pressure)\b'
+    r'[^0-9\n]{0,20}(?P<value>\d+(?:\.\d+)?(?:/\d+)?)\s*(?P<unit>mg/dl|mmol/l|%|mmhg)?', re.IGNORECASE)
+DIAGNOSED = re.compile(r'\s*\((?:diagnosed|dx|since)\s*(?:in\s+)?(?P<when>[^)]*)\)', re.IGNORECASE)
+TIME = re.compile(r'\b\d{1,2}:\d{2}\s*(?:AM|PM)?', re.IGNORECASE)
+
+def _section_kind(heading):
+    heading = heading.lower()
+    for kind, keywords in SECTION_KEYWORDS:
+        if any(keyword in heading for keyword in keywords):
+            return kind
+    return None
+
+def _is_heading(line):
+    return line.endswith(':') and len(line) < 80 and not BULLET.match(line)
+
+def extract_facts(text):
+    """
+    Extract structured facts from medical record text.
+
+    Medications, lab values, diagnoses and allergies are read from the
+    record's sections; lab values named anywhere in the text are picked up
+    too. Appointments come from extract_calendar_events().
+
+    Args:
+        text (str): The medical record text to process
+
+    Returns:
+        dict: Lists of medications, labs, diagnoses, allergies and appointments
+    """
+    facts = {'medications': [], 'labs': [], 'diagnoses': [], 'allergies': [], 'appointments': []}
+    try:
+        events = extract_calendar_events(text)
+        line_dates = {}
+        for event in events:
+            line_dates.setdefault(event['description'], event['date'])
+
+        kind = None
+        section_date = None
+        seen_labs = set()
+        seen_medications = set()
+        appointment_lines = set()
+        for raw_line in text.split('\n'):
+            line = raw_line.strip()
+            if not line:
+                continue
+            if _is_heading(line):
+                kind = _section_kind(line)
+                section_date = line_dates.get(line)
+                continue
+
+            item = BULLET.sub('', line)
+            date = line_dates.get(line) or section_date
+
+            if kind == 'medications' or (kind is None and 'take' in item.lower()):
+                match = MEDICATION.match(item)
+                if match:
+                    medication = {
+                        'name': match.group('name').strip(),
+                        'dose': match.group('dose').replace(' ', ''),
+                        'instructions': match.group('instructions').strip(),
+                    }
+                    key = (medication['name'].lower(), medication['dose'].lower())
+                    if key not in seen_medications:
+                        seen_medications.add(key)
+                        facts['medications'].append(medication)
+                    continue
+            elif kind == 'appointments':
+                appointment_lines.add(line)
+            elif kind == 'labs':
+                match = LAB_ITEM.match(item)
+                if match:
+                    lab = {'name': match.group('name').strip(), 'value': match.group('value'),
+                           'unit': match.group('unit') or '', 'date': date}
+                    facts['labs'].append(lab)
+                    seen_labs.add((lab['name'].lower(), lab['value'], date))
+                    continue
+            elif kind == 'diagnoses':
+                match = DIAGNOSED.search(item)
+                facts['diagnoses'].append({
+                    'name': DIAGNOSED.sub('', item).strip(),
+                    'since': match.group('when').strip() if match else None,
+                })
+                continue
+            elif kind == 'allergies':
+                facts['allergies'].append({'name': item})
+                continue
+
+            for match in LAB_MENTION.finditer(item):
+                line_date = line_dates.get(line)
+                key = (match.group('name').lower(), match.group('value'), line_date)
+                if line_date and key not in seen_labs:
+                    seen_labs.add(key)
+                    facts['labs'].append({'name': match.group('name'), 'value': match.group('value'),
+                                          'unit': match.group('unit') or '', 'date': line_date})
+
+        # Appointments: everything dated in an appointments section, plus appointment events elsewhere
+        for event in events:
+            if event['description'] in appointment_lines or event['category'] == 'appointment':
+                time = TIME.search(event['description'])
+                facts['appointments'].append({
+                    'date': event['date'],
+                    'time': time.group(0) if time else None,
+                    'description': BULLET.sub('', event['description']),
+                })
+        return facts
+
+    except Exception as e:
+        logger.error(f"Error extracting facts: {str(e)}")
+        return facts
+
+class FactTable:
+    """One patient's extracted facts, indexed for lookups by kind and name."""
+
+    def __init__(self, facts):
+        self.facts = facts
+        self._labs_by_name = {}
+        for lab in facts['labs']:
+            self._labs_by_name.setdefault(lab['name'].lower(), []).append(lab)
+        for history in self._labs_by_name.values():
+            history.sort(key=lambda lab: lab['date'] or '')
+
+    @property
+    def medications(self):
+        return self.facts['medications']
+
+    @property
+    def diagnoses(self):
+        return self.facts['diagnoses']
+
+    @property
+    def allergies(self):
+        return self.facts['allergies']
+
+    def latest_labs(self, terms=None):
+        """Most recent value of every lab whose name contains one of terms (all labs if None)."""
+        return [history[-1] for name, history in self._labs_by_name.items()
+                if terms is None or any(term in name for term in terms)]
+
+    def next_appointment(self, today=None):
+        """Return (appointment, is_upcoming): the next one on or after today, else the latest."""
+        appointments = sorted(self.facts['appointments'], key=lambda a: a['date'])
+        if not appointments:
+            return None, False
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        for appointment in appointments:
+            if appointment['date'] >= today:
+                return appointment, True
+        return appointments[-1], False
+
+class FactStore:
+    """Per-patient (or per-record) fact tables, least recently used evicted first."""
+
+    def __init__(self, max_tables=MAX_FACT_TABLES):
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, key, text):
+        """Extract facts from a record and store them under key."""
+        table = FactTable(extract_facts(text))
+        logger.info("Extracted %d medications, %d labs, %d diagnoses, %d appointments",
+                    len(table.medications), len(table.facts['labs']),
+                    len(table.diagnoses), len(table.facts['appointments']))
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def get(self, key):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+            return table
+
+# Shared fact tables, filled at ingestion
+fact_tables = FactStore()
+
+# Whole-question shapes answered from the fact table. A message is answered only if it
+# matches one of these from start to end (after _normalize); anything else,
+# including questions that merely mention a medication, lab or appointment, goes to the LLM.
+_MEDS = r'(?:medications?|meds|medicines?|pills|prescriptions?)'
+_ON = r'(?:am i (?:on|taking)|do i (?:take|have)|have i been prescribed)(?: currently| right now| now)?'
+_FOR = r'for (?:my |the )?(?P<condition>[a-z0-9 ]+)'
+_VISIT = r'(?:appointment|visit|check ?up|follow ?up)'
+_LAB = (r'(?P<lab>(?:ldl |hdl |total )?cholesterol|ldl|hdl|triglycerides|hba1c|a1c|glucose|blood sugar|'
+        r'blood pressure)(?: levels?| numbers?| readings?| results?)?')
+_RECENT = r'(?:latest |last |most recent |recent |current )?'
+QUESTIONS = [
+    ('medications', re.compile(rf'(?:what|which) {_MEDS} {_ON}|what are my (?:current )?{_MEDS}|'
+                               rf'what am i (?:on|taking)|what do i take|list my {_MEDS}')),
+    ('medications', re.compile(rf'(?:what|which) {_MEDS} {_ON} {_FOR}')),
+    ('medications', re.compile(rf'what do i take {_FOR}')),
+    ('medications', re.compile(r'(?:what is|whats) my (?P<condition>[a-z0-9 ]+?) (?:medication|medicine|pill)')),
+    ('medications', re.compile(rf'what (?:dose|dosage) of (?P<name>[a-z0-9 ]+) {_ON}')),
+    ('medications', re.compile(r'(?:what is|whats) my (?P<name>[a-z0-9 ]+?) (?:dose|dosage)')),
+    ('allergies', re.compile(r'what are my allergies|what allergies do i have|do i have any (?:known )?allergies|'
+                             r'(?:what )?am i allergic to(?: anything)?')),
+    ('diagnoses', re.compile(r'what are my (?:diagnoses|(?:medical |health )?conditions)|'
+                             r'what (?:diagnoses|conditions) do i have|what have i been diagnosed with')),
+    ('appointment', re.compile(rf'(?:when is|whens|what is|whats) my next {_VISIT}|'
+                               rf'do i have (?:any|an) upcoming {_VISIT}s?|when do i see (?:the|my) doctor next')),
+    ('labs', re.compile(rf'(?:what (?:was|is|were|are)|whats) my {_RECENT}{_LAB}|'
+                        rf'what (?:were|are) my {_RECENT}(?:lab results|labs|blood work results|test results)')),
+]
+# Lab words in a question -> substrings of lab names they cover
+LAB_TERMS = {
+    'cholesterol': ['cholesterol', 'triglycerides', 'ldl', 'hdl'],
+    'ldl': ['ldl'],
+    'hdl': ['hdl'],
+    'triglycerides': ['triglycerides'],
+    'a1c': ['a1c'],
+    'hba1c': ['a1c'],
+    'glucose': ['glucose'],
+    'blood sugar': ['glucose', 'a1c'],
+    'blood pressure': ['blood pressure'],
+}
+
+class FactAnswer(NamedTuple):
+    """A reply built from the fact table without calling the LLM."""
+    intent: str
+    text: str
+
+def _format_lab(lab):
+    unit = f" {lab['unit']}" if lab['unit'] and lab['unit'] != '%' else lab['unit']
+    return f"{lab['name']} {lab['value']}{unit}"
+
+def _normalize(message):
+    """Lowercase, drop apostrophes, turn other punctuation into spaces and collapse whitespace."""
+    text = re.sub(r'[^a-z0-9 ]', ' ', (message or '').lower().replace("'", ''))
+    return ' '.join(text.split())
+
+def _medications_asked_about(table, match):
+    """
+    The medications a matched question is about: the one it names, those taken
+    for the condition it names, or all of them. None when the record has none
+    that fit, so the LLM can say so properly.
+    """
+    groups = {k: v for k, v in match.groupdict().items() if v}
+    if 'name' in groups:
+        named = [m for m in table.medications if m['name'].lower() == groups['name'].strip()]
+        return named or None
+    if 'condition' in groups:
+        words = [w for w in groups['condition'].split() if len(w) > 3]
+        matching = [m for m in table.medications
+                    if words and all(w in m['instructions'].lower() for w in words)]
+        return matching or None
+    return table.medications
+
+def _answer_labs(table, match):
+    lab = match.groupdict().get('lab')
+    terms = [term for word, names in LAB_TERMS.items() if lab and word in lab for term in names]
+    labs = table.latest_labs(terms or None)
+    if not labs:
+        return None
+    by_date = OrderedDict()
+    for lab in sorted(labs, key=lambda lab: lab['date'] or '', reverse=True):
+        by_date.setdefault(lab['date'], []).append(_format_lab(lab))
+    parts = [', '.join(values) + (f" (on {date})" if date else '') for date, values in by_date.items()]
+    return f"Your most recent results in your record: {'; '.join(parts)}."
+
+def answer_question(table, message, today=None):
+    """
+    Answer a simple factual question straight from a fact table.
+
+    Args:
+        table (FactTable): The patient's facts, or None
+        message (str): The user's message
+        today (str): YYYY-MM-DD used for "next appointment", defaults to today
+
+    Returns:
+        FactAnswer: The reply, or None if the LLM should handle the message
+    """
+    text = _normalize(message)
+    match = None
+    if table is not None and text:
+        match = next(((intent, m) for intent, pattern in QUESTIONS
+                      for m in [pattern.fullmatch(text)] if m), None)
+    if match is None:
+        cache_requests.inc(cache='fact_table', result='miss')
+        return None
+
+    intent, match = match
+    reply = None
+    if intent == 'medications' and table.medications:
+        medications = _medications_asked_about(table, match)
+        if medications:
+            items = '\n'.join(f"- {m['name']} {m['dose']}" + (f": {m['instructions']}" if m['instructions'] else '')
+                              for m in medications)
+            reply = f"According to your record, you're currently taking:\n{items}"
+    elif intent == 'labs':
+        reply = _answer_labs(table, match)
+    elif intent == 'appointment':
+        appointment, upcoming = table.next_appointment(today)
+        if appointment is not None:
+            when = appointment['date'] + (f" at {appointment['time']}" if appointment['time'] else '')
+            if upcoming:
+                reply = f"Your next appointment is on {when}: {appointment['description']}"
+            else:
+                reply = (f"I don't see any upcoming appointments in your record. The most recent one "
+                         f"listed was on {when}: {appointment['description']}")
+    elif intent == 'diagnoses' and table.diagnoses:
+        items = '\n'.join(f"- {d['name']}" + (f" (since {d['since']})" if d['since'] else '')
+                          for d in table.diagnoses)
+        reply = f"Your record lists these diagnoses:\n{items}"
+    elif intent == 'allergies' and table.allergies:
+        reply = "Your record lists allergies to: " + ', '.join(a['name'] for a in table.allergies) + "."
+    if reply:
+        cache_requests.inc(cache='fact_table', result='hit')
+        return FactAnswer(intent, reply)
+
+    cache_requests.inc(cache='fact_table', result='miss')
+    return None
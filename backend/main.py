@@ -1,61 +1,153 @@
 from flask import Flask, request, jsonify, send_from_directory, Response, send_file
+from werkzeug.exceptions import NotFound
 from datetime import datetime
 from flask_cors import CORS
 import os
 import logging
-from pdf_loader import load_pdf_text
+from pdf_loader import load_pdf_bytes
 import groq
 from dotenv import load_dotenv
 import tempfile
-from audio import transcribe_audio, client as elevenlabs_client, listen, speak
+import threading
+from audio import transcribe_audio_bytes, synthesize_speech, listen, speak
+from audio_ingest import AudioDecodeError, prepare_for_transcription
+from batch_transcribe import BatchBusy, batch_jobs
 from io import BytesIO
 import json
-from event_extractor import extract_events
+from session_store import sessions, estimate_tokens
+from prompts import document_version, get_prefix
+from model_router import route_query
+from fact_table import fact_tables, answer_question
+from single_flight import groq_chat_flight, request_key
+from scheduler import scheduler, PRIORITY_CHAT, PRIORITY_VOICE
+from request_logging import configure_logging, init_request_logging
+from metrics import span, record_usage, render_metrics, init_request_metrics
+from static_assets import StaticAssetCache
+from voice_ws import init_voice_socket
+from warmup import Warmup
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (queue-based, level from LOG_LEVEL)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize Groq client
-client = groq.Client(api_key=os.getenv("GROQ_API_KEY"))
-
-app = Flask(__name__, static_folder='../', static_url_path='')
-CORS(app)
-
-# Global variable to store PDF text
+# Initialize Groq client (no SDK retries: the scheduler handles 429s and backoff)
+client = groq.Client(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+
+def create_completion(priority=PRIORITY_CHAT, **kwargs):
+    """
+    Create a Groq chat completion.
+
+    Identical concurrent requests share one upstream call, and the call waits
+    for admission under Groq's rate limits in the given priority lane.
+    """
+    tokens = sum(estimate_tokens(m['content']) for m in kwargs.get('messages', []))
+    tokens += kwargs.get('max_tokens', 0)
+    def _complete():
+        with span('llm'):
+            response = client.chat.completions.create(**kwargs)
+        record_usage('groq', kwargs.get('model'), response)
+        return response
+
+    return groq_chat_flight.do(
+        request_key('chat', kwargs),
+        lambda: scheduler.call('groq', _complete, priority=priority, tokens=tokens)
+    )
+
+def stream_completion(priority=PRIORITY_VOICE, **kwargs):
+    """
+    Start a streaming Groq chat completion.
+
+    Streams are not coalesced, but still wait for admission under Groq's
+    rate limits in the given priority lane.
+    """
+    tokens = sum(estimate_tokens(m['content']) for m in kwargs.get('messages', []))
+    tokens += kwargs.get('max_tokens', 0)
+    return scheduler.call(
+        'groq',
+        lambda: client.chat.completions.create(stream=True, **kwargs),
+        priority=priority,
+        tokens=tokens
+    )
+
+# No built-in static route: it would match /<filename> before serve_static and bypass the in-memory cache
+app = Flask(__name__, static_folder=None)
+# Expose X-Session-Id so browser clients of /listen can keep their conversation going
+CORS(app, expose_headers=['X-Session-Id'])
+
+# Request bodies over this size are rejected with 413 while they stream in
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "64"))
+MAX_PDF_MB = int(os.getenv("MAX_PDF_MB", "20"))
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Global variables to store PDF text and its version
 pdf_text = None
-
-@app.before_request
-def log_request_info():
-    logger.debug('Headers: %s', request.headers)
-    logger.debug('Body: %s', request.get_data())
-    logger.debug('Files: %s', request.files)
-    logger.debug('Form: %s', request.form)
-
-@app.after_request
-def log_response_info(response):
-    # Only log response data for JSON responses
-    if response.mimetype == 'application/json':
-        logger.debug('Response: %s', response.get_data())
-    return response
+pdf_version = None
+
+# Set when the process is shutting down; /readyz then reports not ready
+draining = threading.Event()
+
+# Static assets are precompressed and served from memory
+STATIC_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+static_assets = StaticAssetCache(STATIC_ROOT)
+
+# Request logging never reads upload bodies or logs patient content
+STATIC_ENDPOINTS = {'index', 'serve_static'}
+PROBE_ENDPOINTS = {'metrics', 'healthz', 'readyz'}
+init_request_logging(app, skip_endpoints=PROBE_ENDPOINTS | STATIC_ENDPOINTS)
+init_request_metrics(app, skip_endpoints=PROBE_ENDPOINTS | STATIC_ENDPOINTS | {'voice_socket'})
+
+# Optional post-upload precomputation (WARMUP_ENABLED=1): summary, common answers, greeting audio
+warmup = Warmup(create_completion)
+
+def current_prefix():
+    # The prompt prefix for the loaded record, or None before any upload
+    if not pdf_text:
+        return None
+    return get_prefix(pdf_text, pdf_version)
+
+def prefix_for(session_id, route):
+    # The warmed-up summary only serves a session's opening small talk. Every later turn and every
+    # record question uses the full record, so a session's prefix stays byte-identical from its
+    # second turn on and facts never come from the lossy summary.
+    if route.task == 'smalltalk' and not sessions.has_history(session_id):
+        prefix = warmup.summary_prefix(pdf_version)
+        if prefix is not None:
+            return prefix
+    return get_prefix(pdf_text, pdf_version)
+
+def instant_answer(session_id, message):
+    # Replies that need no completion: fact-table lookups, then precomputed answers on a session's first turn
+    fact_answer = answer_question(fact_tables.get(pdf_version), message)
+    if fact_answer is not None:
+        logger.info('Answered %s question from the fact table', fact_answer.intent)
+        return fact_answer.text
+    if not sessions.has_history(session_id):
+        answer = warmup.answer(pdf_version, message)
+        if answer is not None:
+            logger.info('Answered common question from the warm-up cache')
+            return answer
+    return None
+
+# Full-duplex voice: streamed transcription, tokens and TTS with barge-in
+init_voice_socket(app, stream_completion, current_prefix, prefix_for, instant_answer)
 
 @app.route('/')
 def index():
-    logger.info('Serving index.html')
     try:
-        return send_from_directory(app.static_folder, 'index.html')
+        return static_assets.send('index.html')
     except Exception as e:
         logger.error('Error serving index.html: %s', str(e))
         return str(e), 500
 
 @app.route('/<path:path>')
 def serve_static(path):
-    logger.info('Serving static file: %s', path)
     try:
-        return send_from_directory(app.static_folder, path)
+        return static_assets.send(path)
+    except NotFound:
+        return 'Not found', 404
     except Exception as e:
         logger.error('Error serving static file %s: %s', path, str(e))
         return str(e), 404
@@ -65,8 +157,29 @@ def test():
     logger.info('Test endpoint called')
     return jsonify({"message": "Server is working!"})
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: take this worker out of rotation while it drains
+    if draining.is_set():
+        return jsonify({'status': 'draining'}), 503
+    return jsonify({'status': 'ready'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': 'File too large'}), 413
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    global pdf_text, pdf_version
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -75,16 +188,26 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and file.filename.endswith('.pdf'):
-        # Save the file temporarily
-        temp_path = os.path.join('temp', file.filename)
-        os.makedirs('temp', exist_ok=True)
-        file.save(temp_path)
+        # Read at most one byte past the PDF cap, so oversized files are never fully buffered
+        max_bytes = MAX_PDF_MB * 1024 * 1024
+        data = file.stream.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            return jsonify({'error': f'PDF is larger than {MAX_PDF_MB} MB'}), 413
         
-        # Process the PDF
-        text = load_pdf_text(temp_path)
+        # Process the PDF in a sandboxed worker (time and memory limited)
+        text = load_pdf_bytes(data)
         
-        # Clean up
-        os.remove(temp_path)
+        if text:
+            # Version the record once so prompt prefixes are built once per upload
+            new_text = text['text']
+            new_version = document_version(new_text)
+            get_prefix(new_text, new_version)
+            # Structured facts answer common lookups without the LLM
+            fact_tables.build(new_version, new_text)
+            # Publish text and version together, after their caches exist, so a concurrent
+            # request never pairs the new record with the old version
+            pdf_text, pdf_version = new_text, new_version
+            warmup.start(new_text, new_version)
         
         return jsonify({'text': text})
     
@@ -96,51 +219,37 @@ def chat():
         logger.info('Received chat request')
         data = request.json
         message = data.get('message', '')
+        session_id = data.get('session_id') or sessions.new_session_id()
         
         if not pdf_text:
             logger.error('No PDF loaded')
             return jsonify({'response': 'Please upload a PDF first.'})
         
-        # Create the system prompt with the medical record
-        system_prompt = """
-You are Deha AI, a compassionate and knowledgeable medical case manager.
-Your primary responsibility is to assist the individual in understanding and managing their health based on their provided medical record.
-You should engage in a continuous conversation, answering questions directly and providing relevant information and guidance derived *only* from the medical data.
-
-Maintain a warm, empathetic, and encouraging tone throughout the conversation.
-Explain medical terms and concepts in a clear and accessible way, avoiding jargon where possible.
-When responding to questions, always consider the specific conditions, medications, and recent lab results presented in the medical record.
-
-Instead of simply stating facts, weave them into your responses naturally as part of the ongoing dialogue.
-Offer practical advice and considerations tailored to the individual's situation.
-For example, when discussing diet or exercise, highlight aspects relevant to their conditions, cholesterol levels, and blood pressure.
-Encourage them to take an active role in their health management and always suggest consulting their doctor for any significant changes or concerns.
-
-Avoid explicitly stating that you are 'thinking' or outlining your internal reasoning steps.
-Your responses should flow naturally as if you are genuinely engaged in a conversation.
-
-Your goal is to make the individual feel supported, informed, and empowered in managing their health.
-"""
+        # Medications, lab values, appointments and warmed-up common questions need no completion
+        answer = instant_answer(session_id, message)
+        if answer is not None:
+            sessions.record_turn(session_id, message, answer)
+            return jsonify({'response': answer, 'session_id': session_id})
         
-        # Create messages for the chat
-        messages = [
-            {"role": "system", "content": f"{system_prompt}\n\nMedical Record:\n{pdf_text}"},
-            {"role": "user", "content": message}
-        ]
+        # Create messages for the chat, including this session's history
+        route = route_query(message)
+        prefix = prefix_for(session_id, route)
+        messages = sessions.build_messages(session_id, prefix.text, message)
         
         logger.info('Sending request to Groq')
         # Get response from Groq
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        response = create_completion(
+            model=route.model,
             messages=messages,
             temperature=0.7,
-            max_tokens=200,
+            max_tokens=route.max_tokens,
             stream=False
         )
         
         ai_response = response.choices[0].message.content.strip()
         logger.info('Received response from Groq')
-        return jsonify({'response': ai_response})
+        sessions.record_turn(session_id, message, ai_response)
+        return jsonify({'response': ai_response, 'session_id': session_id})
         
     except Exception as e:
         logger.error('Error in chat: %s', str(e), exc_info=True)
@@ -155,78 +264,97 @@ def voice():
             return jsonify({'error': 'No audio file provided'}), 400
             
         audio_file = request.files['audio_file']
+        session_id = request.form.get('session_id') or sessions.new_session_id()
         
         if not pdf_text:
             logger.error('No PDF loaded')
             return jsonify({'response': 'Please upload a PDF first.'})
         
-        # Save the audio file temporarily
-        temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-        audio_file.save(temp_audio.name)
+        # Decode (WAV, WebM/Opus, OGG, ...), downsample to 16 kHz mono and trim silence in memory
+        try:
+            wav_bytes = prepare_for_transcription(audio_file.read())
+        except AudioDecodeError as e:
+            logger.error('Could not decode audio upload: %s', str(e))
+            return jsonify({'error': 'Unsupported or corrupt audio file'}), 400
         
-        # Transcribe the audio using Groq's Whisper
-        transcript = transcribe_audio(temp_audio.name)
+        if not wav_bytes:
+            return jsonify({'error': 'No speech detected'}), 400
         
-        # Clean up the temporary audio file after transcription
-        os.unlink(temp_audio.name)
+        # Transcribe the audio using Groq's Whisper
+        transcript = transcribe_audio_bytes(wav_bytes)
 
         if not transcript:
             return jsonify({'error': 'Failed to transcribe audio'}), 400
-            
-        # Create the system prompt with the medical record
-        system_prompt = """
-You are Deha AI, a compassionate and knowledgeable medical case manager.
-Your primary responsibility is to assist the individual in understanding and managing their health based on their provided medical record.
-You should engage in a continuous conversation, answering questions directly and providing relevant information and guidance derived *only* from the medical data.
-
-Maintain a warm, empathetic, and encouraging tone throughout the conversation.
-Explain medical terms and concepts in a clear and accessible way, avoiding jargon where possible.
-When responding to questions, always consider the specific conditions, medications, and recent lab results presented in the medical record.
-
-Instead of simply stating facts, weave them into your responses naturally as part of the ongoing dialogue.
-Offer practical advice and considerations tailored to the individual's situation.
-For example, when discussing diet or exercise, highlight aspects relevant to their conditions, cholesterol levels, and blood pressure.
-Encourage them to take an active role in their health management and always suggest consulting their doctor for any significant changes or concerns.
-
-Avoid explicitly stating that you are 'thinking' or outlining your internal reasoning steps.
-Your responses should flow naturally as if you are genuinely engaged in a conversation.
-
-Your goal is to make the individual feel supported, informed, and empowered in managing their health.
-"""
         
-        # Create messages for the chat
-        messages = [
-            {"role": "system", "content": f"{system_prompt}\n\nMedical Record:\n{pdf_text}"},
-            {"role": "user", "content": transcript}
-        ]
+        answer = instant_answer(session_id, transcript)
+        if answer is not None:
+            sessions.record_turn(session_id, transcript, answer)
+            return jsonify({
+                'transcript': transcript,
+                'response': answer,
+                'session_id': session_id
+            })
+            
+        # Create messages for the chat, including this session's history
+        route = route_query(transcript)
+        prefix = prefix_for(session_id, route)
+        messages = sessions.build_messages(session_id, prefix.text, transcript)
         
         logger.info('Sending transcribed text to Groq')
         # Get response from Groq (using the main client)
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        response = create_completion(
+            priority=PRIORITY_VOICE,
+            model=route.model,
             messages=messages,
             temperature=0.7,
-            max_tokens=200,
+            max_tokens=route.max_tokens,
             stream=False
         )
         
         ai_response = response.choices[0].message.content.strip()
         logger.info('Received response from Groq')
         
+        sessions.record_turn(session_id, transcript, ai_response)
+        
         # We don't perform TTS here, the frontend will call the /tts endpoint
         
         return jsonify({
             'transcript': transcript,
-            'response': ai_response
+            'response': ai_response,
+            'session_id': session_id
         })
         
     except Exception as e:
         logger.error('Error in voice: %s', str(e), exc_info=True)
-        # Ensure temp file is cleaned up even on error if it was created
-        if 'temp_audio' in locals() and os.path.exists(temp_audio.name):
-            os.unlink(temp_audio.name)
         return jsonify({'error': 'Sorry, I encountered an error while processing your request.'}), 500
 
+@app.route('/transcribe/batch', methods=['POST'])
+def transcribe_batch():
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({'error': 'No audio files provided'}), 400
+    
+    # Long recordings are split at pauses and transcribed in parallel in the background
+    try:
+        job_id = batch_jobs.submit([(f.filename, f.read()) for f in files])
+    except BatchBusy as e:
+        logger.warning('Rejected batch transcription: %s', str(e))
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
+    logger.info('Started batch transcription job %s for %d files', job_id, len(files))
+    return jsonify({'job_id': job_id, 'status': 'running'}), 202
+
+@app.route('/transcribe/batch/<job_id>', methods=['GET'])
+def transcribe_batch_status(job_id):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/greeting', methods=['GET'])
+def greeting():
+    # The greeting text; its audio is pre-synthesized by warm-up, so POSTing it to /tts returns instantly
+    return jsonify({'text': warmup.greeting})
+
 @app.route('/tts', methods=['POST'])
 def text_to_speech():
     try:
@@ -237,17 +365,11 @@ def text_to_speech():
             return jsonify({'error': 'No text provided'}), 400
             
         logger.info('Converting text to speech with ElevenLabs')
-        # Convert text to speech using ElevenLabs (using the imported client)
-        audio = elevenlabs_client.text_to_speech.convert(
-            text=text,
-            voice_id="19STyYD15bswVz51nqLf",  # Default voice ID
-            model_id="eleven_multilingual_v2",
-            output_format="mp3_44100_128",
-        )
+        # Greeting and common answers may already be synthesized; otherwise use ElevenLabs
+        audio = warmup.speech(text) or synthesize_speech(text, priority=PRIORITY_CHAT)
         
         # Create a temporary file to store the audio
         temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        # ElevenLabs convert returns bytes directly, no need to read
         temp_audio.write(audio)
         temp_audio.close()
         
@@ -272,6 +394,7 @@ def text_to_speech():
 def listen_endpoint():
     logger.info("=== Starting /listen endpoint ===")
     try:
+        session_id = request.values.get('session_id') or sessions.new_session_id()
         if not pdf_text:
             logger.error("No PDF loaded")
             return jsonify({"error": "Please upload a PDF first"}), 400
@@ -281,66 +404,37 @@ def listen_endpoint():
         transcript = listen()
         
         # Explicitly log the received transcript value and its type
-        logger.info(f"Received transcript value: '{transcript}', Type: {type(transcript)}")
+        logger.info(f"Received transcript of {len(transcript or '')} characters")
         
         # Check if transcript is empty or very short after logging
         # Consider single characters or very short strings as potentially failed transcription
         if not transcript or len(transcript.strip()) < 2:
-            logger.warning(f"Transcript is empty or too short: '{transcript}'. Treating as no speech detected.")
+            logger.warning("Transcript is empty or too short. Treating as no speech detected.")
             # Return a specific message if no speech is detected, as this is expected behavior if user doesn't speak
             return jsonify({"message": "No speech detected"}), 200 # Return 200 as it's not a fatal error
 
-        # Create system prompt for Groq
-        system_prompt = """
-You are Deha AI, a compassionate and knowledgeable medical case manager.
-Your primary responsibility is to assist the individual in understanding and managing their health based on their provided medical record.
-You should engage in a continuous conversation, answering questions directly and providing relevant information and guidance derived *only* from the medical data.
-
-Maintain a warm, empathetic, and encouraging tone throughout the conversation.
-Explain medical terms and concepts in a clear and accessible way, avoiding jargon where possible.
-When responding to questions, always consider the specific conditions, medications, and recent lab results presented in the medical record.
-
-Instead of simply stating facts, weave them into your responses naturally as part of the ongoing dialogue.
-Offer practical advice and considerations tailored to the individual's situation.
-For example, when discussing diet or exercise, highlight aspects relevant to their conditions, cholesterol levels, and blood pressure.
-Encourage them to take an active role in their health management and always suggest consulting their doctor for any significant changes or concerns.
-
-Avoid explicitly stating that you are 'thinking' or outlining your internal reasoning steps.
-Your responses should flow naturally as if you are genuinely engaged in a conversation.
-
-Your goal is to make the individual feel supported, informed, and empowered in managing their health.
-
-
-Medical Record:
-""" + pdf_text
-
-        logger.info(f"Sending request to Groq with transcript: '{transcript}'")
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": transcript}
-            ],
-            model="llama-3.3-70b-versatile",
-            max_tokens=200,
-            stream=False,
-            temperature=0.7
-        )
-        logger.info("Received response from Groq")
-        ai_response = response.choices[0].message.content.strip()
-
-        # Convert response to speech using ElevenLabs client directly
+        ai_response = instant_answer(session_id, transcript)
+        if ai_response is None:
+            # Shared system prompt + medical record prefix (or its summary for fast-model turns)
+            route = route_query(transcript)
+            prefix = prefix_for(session_id, route)
+            logger.info("Sending transcript to Groq")
+            response = create_completion(
+                priority=PRIORITY_VOICE,
+                messages=sessions.build_messages(session_id, prefix.text, transcript),
+                model=route.model,
+                max_tokens=route.max_tokens,
+                stream=False,
+                temperature=0.7
+            )
+            logger.info("Received response from Groq")
+            ai_response = response.choices[0].message.content.strip()
+        sessions.record_turn(session_id, transcript, ai_response)
+
+        # Convert response to speech, reusing audio synthesized during warm-up
         logger.info("Converting response to speech using ElevenLabs")
-        # Assuming elevenlabs_client.text_to_speech.convert returns a generator
-        audio_generator = elevenlabs_client.text_to_speech.convert(
-            text=ai_response,
-            voice_id="19STyYD15bswVz51nqLf",  # Default voice ID
-            model_id="eleven_multilingual_v2",
-            output_format="mp3_44100_128",
-        )
-
-        # Collect audio bytes from the generator
-        audio_bytes = b''.join(list(audio_generator))
-        logger.info(f"Collected {len(audio_bytes)} bytes from ElevenLabs generator")
+        audio_bytes = warmup.speech(ai_response) or synthesize_speech(ai_response)
+        logger.info(f"Collected {len(audio_bytes)} bytes from ElevenLabs")
 
         # Use BytesIO to create an in-memory binary stream
         audio_stream = BytesIO(audio_bytes)
@@ -349,12 +443,15 @@ Medical Record:
         # Send audio file
         logger.info("Sending audio stream")
         # send_file can handle BytesIO objects
-        return send_file(
+        audio_response = send_file(
             audio_stream,
             mimetype='audio/mpeg',
             as_attachment=False, # Set to False for direct playback in browser
             download_name='response.mp3'
         )
+        # Let the client keep the conversation going on the next turn
+        audio_response.headers['X-Session-Id'] = session_id
+        return audio_response
 
     except Exception as e:
         logger.error(f"Error in /listen endpoint: {str(e)}")
@@ -0,0 +1,211 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set METRICS_ENABLED=0 to turn every span and counter into a no-op
+ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """A value per label set that can go up and down."""
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+# Metrics
+stage_seconds = Histogram('deha_stage_duration_seconds', 'Time spent in each pipeline stage')
+stage_errors = Counter('deha_stage_errors_total', 'Pipeline stage failures')
+request_seconds = Histogram('deha_request_duration_seconds', 'HTTP request latency by endpoint')
+requests_in_flight = Gauge('deha_requests_in_flight', 'HTTP requests currently being handled')
+upstream_tokens = Counter('deha_upstream_tokens_total', 'Tokens reported by upstream LLM responses')
+cache_requests = Counter('deha_cache_requests_total', 'Cache lookups by cache and result')
+
+METRICS = [stage_seconds, stage_errors, request_seconds, requests_in_flight, upstream_tokens, cache_requests]
+
+# Callables returning extra metric lines at scrape time (for state owned elsewhere)
+_collectors = []
+
+def register_collector(fn):
+    """Register a function returning a list of exposition lines at scrape time."""
+    _collectors.append(fn)
+    return fn
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+@contextmanager
+def _timed_span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+def span(stage):
+    """
+    Time a block of code as a pipeline stage.
+
+    Usage:
+        with span('llm'):
+            ...
+    """
+    if not ENABLED:
+        return _NOOP_SPAN
+    return _timed_span(stage)
+
+def timed(stage):
+    """Decorator form of span() for a whole function."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timed_span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(provider, model, response):
+    """Count prompt and completion tokens from an OpenAI-style response."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    upstream_tokens.inc(getattr(usage, 'prompt_tokens', 0) or 0,
+                        provider=provider, model=model, kind='prompt')
+    upstream_tokens.inc(getattr(usage, 'completion_tokens', 0) or 0,
+                        provider=provider, model=model, kind='completion')
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {str(e)}")
+    return '\n'.join(lines) + '\n'
+
+def init_request_metrics(app, skip_endpoints=()):
+    """Track per-endpoint latency and in-flight requests on a Flask app."""
+    from flask import g, request
+
+    if not ENABLED:
+        return
+    skip_endpoints = set(skip_endpoints)
+
+    @app.before_request
+    def start_request_timer():
+        if request.endpoint in skip_endpoints:
+            return
+        g.metrics_endpoint = request.endpoint or 'unknown'
+        g.metrics_start = time.perf_counter()
+        requests_in_flight.inc(endpoint=g.metrics_endpoint)
+
+    @app.teardown_request
+    def stop_request_timer(exc):
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is None:
+            return
+        requests_in_flight.dec(endpoint=endpoint)
+        request_seconds.observe(time.perf_counter() - g.pop('metrics_start'), endpoint=endpoint)
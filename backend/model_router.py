@@ -0,0 +1,120 @@
+import os
+import re
+from typing import NamedTuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Models
+LARGE_MODEL = os.getenv("GROQ_LARGE_MODEL", "llama-3.3-70b-versatile")
+FAST_MODEL = os.getenv("GROQ_FAST_MODEL", "llama-3.1-8b-instant")
+
+# Below this confidence the request always goes to the large model
+MIN_CONFIDENCE = 0.6
+
+# Per-class model tier and response length
+ROUTES = {
+    'smalltalk': {'model': FAST_MODEL, 'max_tokens': 60},
+    'lookup': {'model': FAST_MODEL, 'max_tokens': 120},
+    'calendar': {'model': FAST_MODEL, 'max_tokens': 120},
+    'advice': {'model': LARGE_MODEL, 'max_tokens': 300},
+}
+DEFAULT_ROUTE = {'model': LARGE_MODEL, 'max_tokens': 200}
+
+# Keyword patterns per class, checked against the lowercased message
+PATTERNS = {
+    'smalltalk': [
+        r'^(hi|hello|hey|good (morning|afternoon|evening))\b',
+        r'^(thanks|thank you|ok|okay|great|bye|goodbye)\b',
+    ],
+    'lookup': [
+        r'\bwhat (is|are|was|were) my\b',
+        r'\b(which|what) (medications?|meds|drugs|pills|doses?|dosage)\b',
+        r'\bhow much\b',
+        r'\b(cholesterol|ldl|hdl|a1c|glucose|blood pressure|bp|weight|bmi|heart rate)\b',
+        r'\b(diagnos(is|es|ed)|allerg(y|ies))\b',
+        r'\b(numbers|levels?|results?|readings?)\b',
+    ],
+    'calendar': [
+        r'\b(appointment|visit|follow[- ]?up|check[- ]?up|schedule[sd]?)\b',
+        r'\bwhen (is|was|are|do|should)\b',
+        r'\b(next|last|upcoming) (appointment|visit|test|refill)\b',
+        r'\b(refill|date)\b',
+    ],
+    'advice': [
+        r'\bshould i\b',
+        r'\b(can|could) i\b',
+        r'\b(why|explain|what does .* mean|what happens)\b',
+        r'\b(diet|exercise|food|eat|lifestyle|manage|improve|lower|reduce|worried|risk)\b',
+        r'\bhow (do|can|should) i\b',
+    ],
+}
+_COMPILED = {name: [re.compile(p) for p in patterns] for name, patterns in PATTERNS.items()}
+
+# Messages longer than this are treated as open-ended regardless of keywords
+LONG_MESSAGE_WORDS = 40
+
+class Route(NamedTuple):
+    """Where and how to send a completion request."""
+    task: str
+    model: str
+    max_tokens: int
+    confidence: float
+
+def classify(message):
+    """
+    Classify a user message into a task class.
+
+    Args:
+        message (str): The user's message
+
+    Returns:
+        tuple: (task class, confidence between 0 and 1)
+    """
+    text = (message or '').strip().lower()
+    if not text:
+        return 'advice', 0.0
+
+    words = len(text.split())
+    if words > LONG_MESSAGE_WORDS:
+        return 'advice', 0.9
+
+    scores = {
+        name: sum(1 for pattern in patterns if pattern.search(text))
+        for name, patterns in _COMPILED.items()
+    }
+    total = sum(scores.values())
+    if total == 0:
+        return 'advice', 0.0
+
+    task = max(scores, key=scores.get)
+    confidence = scores[task] / total
+    # Anything asking for advice alongside a lookup needs the large model
+    if task != 'advice' and scores['advice']:
+        confidence = min(confidence, 0.5)
+    # Short messages with a single clear class are easy to route
+    if words <= 12 and confidence == 1.0:
+        confidence = 0.95
+    return task, confidence
+
+def route_query(message):
+    """
+    Choose the model and max_tokens for a user message.
+
+    Simple lookups, calendar questions and small talk go to the fast model;
+    open-ended advice and anything we're unsure about go to the large model.
+
+    Args:
+        message (str): The user's message
+
+    Returns:
+        Route: The chosen task, model, max_tokens and confidence
+    """
+    task, confidence = classify(message)
+    settings = ROUTES.get(task, DEFAULT_ROUTE)
+    if confidence < MIN_CONFIDENCE:
+        settings = DEFAULT_ROUTE if task != 'advice' else ROUTES['advice']
+    route = Route(task, settings['model'], settings['max_tokens'], confidence)
+    logger.info("Routed %s query (confidence %.2f) to %s, max_tokens=%d",
+                route.task, route.confidence, route.model, route.max_tokens)
+    return route
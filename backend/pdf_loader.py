@@ -1,6 +1,7 @@
-import PyPDF2
 import os
-from .calendar_utils import extract_calendar_events
+from calendar_utils import extract_calendar_events
+from metrics import span, timed
+from pdf_sandbox import sandbox
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,34 +23,44 @@ def load_pdf_text(filepath):
             
         print(f"Opening PDF file: {filepath}")
         with open(filepath, 'rb') as file:
-            # Create PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
+            return load_pdf_bytes(file.read())
             
-            # Check if PDF is encrypted
-            if pdf_reader.is_encrypted:
-                print("PDF is encrypted")
-                return None
-                
-            # Extract text from each page
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-                
-            if not text.strip():
-                print("No text extracted from PDF")
-                return None
-                
-            print(f"Successfully extracted {len(text)} characters from PDF")
-            
-            # Extract calendar events from the text
-            calendar_events = extract_calendar_events(text)
-            logger.info(f"Extracted {len(calendar_events)} calendar events from PDF")
+    except Exception as e:
+        print(f"Error loading PDF: {str(e)}")
+        return None
+
+@timed('pdf_extract')
+def load_pdf_bytes(data):
+    """
+    Extract text from PDF contents in a sandboxed worker process.
+    
+    Args:
+        data (bytes): The PDF file contents
+        
+    Returns:
+        dict: Extracted text and calendar events, or None if there was an error
+    """
+    try:
+        # PyPDF2 runs in a separate process with time and memory limits
+        text = sandbox.extract(data)
             
-            return {
-                'text': text,
-                'calendar_events': calendar_events
-            }
+        if not text.strip():
+            print("No text extracted from PDF")
+            return None
             
+        print(f"Successfully extracted {len(text)} characters from PDF")
+        
+        # Extract calendar events from the text
+        with span('calendar_extract'):
+            calendar_events = extract_calendar_events(text)
+        logger.info(f"Extracted {len(calendar_events)} calendar events from PDF")
+        
+        return {
+            'text': text,
+            'calendar_events': calendar_events
+        }
+        
     except Exception as e:
+        # Includes PdfExtractionError and failures to start or talk to a worker
         print(f"Error loading PDF: {str(e)}")
         return None
@@ -0,0 +1,247 @@
+"""
+Isolated PDF text extraction.
+
+PyPDF2 runs in separate worker processes (this file, started with
+--worker) so a malformed or huge PDF can only hurt its own worker: each
+job has a wall-clock limit enforced by the parent, each worker has an
+address-space limit set with RLIMIT_AS, and workers exit after a fixed
+number of jobs so leaked memory is returned to the OS.
+
+The worker only imports the standard library and PyPDF2; it never imports
+the Flask app.
+"""
+import atexit
+import io
+import json
+import os
+import queue
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("PDF_WORKERS", "2"))
+JOB_TIMEOUT = float(os.getenv("PDF_JOB_TIMEOUT", "20"))           # Seconds per document
+MEMORY_LIMIT_MB = int(os.getenv("PDF_WORKER_MEMORY_MB", "512"))   # Address space per worker
+MAX_JOBS_PER_WORKER = int(os.getenv("PDF_WORKER_MAX_JOBS", "50"))
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+MAX_TEXT_CHARS = int(os.getenv("PDF_MAX_TEXT_CHARS", str(5 * 1024 * 1024)))
+
+_HEADER = struct.Struct('!I')
+
+class PdfExtractionError(Exception):
+    """Raised when a PDF can't be extracted within the sandbox limits."""
+
+# Framing: 4-byte big-endian length, then the payload. Nothing is unpickled:
+# a job is a JSON header frame plus a raw PDF frame, a reply one JSON frame.
+
+def _write_frames(stream, *payloads):
+    for payload in payloads:
+        stream.write(_HEADER.pack(len(payload)))
+        stream.write(payload)
+    stream.flush()
+
+def _read_exact(fd, size, deadline):
+    chunks = []
+    while size:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            raise TimeoutError
+        chunk = os.read(fd, min(size, 1 << 20))
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _read_frame(fd, deadline=None, max_size=None):
+    (size,) = _HEADER.unpack(_read_exact(fd, _HEADER.size, deadline))
+    if max_size is not None and size > max_size:
+        raise ValueError(f"Frame of {size} bytes exceeds {max_size}")
+    return _read_exact(fd, size, deadline)
+
+def _read_reply(fd, deadline, max_chars):
+    # UTF-8 needs at most 4 bytes per character, plus room for the JSON wrapping
+    reply = json.loads(_read_frame(fd, deadline, max_size=4 * max_chars + 4096))
+    if not (isinstance(reply, dict) and reply.get('status') in ('ok', 'error')
+            and isinstance(reply.get('value'), str)):
+        raise ValueError("Malformed reply from PDF worker")
+    return reply['status'], reply['value']
+
+# Worker side
+
+def _extract(data, max_pages, max_chars):
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        raise ValueError("PDF is encrypted")
+    if len(reader.pages) > max_pages:
+        raise ValueError(f"PDF has {len(reader.pages)} pages, the limit is {max_pages}")
+    parts = []
+    size = 0
+    for page in reader.pages:
+        page_text = (page.extract_text() or '') + "\n"
+        size += len(page_text)
+        if size > max_chars:
+            raise ValueError(f"PDF text exceeds {max_chars} characters")
+        parts.append(page_text)
+    return ''.join(parts)
+
+def _worker_main(memory_limit, max_jobs):
+    import resource
+
+    # Keep the protocol channel private; anything PyPDF2 prints goes to stderr
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    stdin_fd = sys.stdin.fileno()
+    for _ in range(max_jobs):
+        try:
+            limits = json.loads(_read_frame(stdin_fd))
+            data = _read_frame(stdin_fd)
+        except EOFError:
+            return
+        try:
+            result = {'status': 'ok', 'value': _extract(data, limits['max_pages'], limits['max_chars'])}
+        except MemoryError:
+            result = {'status': 'error', 'value': "PDF needs more memory than the extraction limit"}
+        except Exception as e:
+            result = {'status': 'error', 'value': f"Could not read PDF: {str(e)}"}
+        data = None
+        _write_frames(channel, json.dumps(result).encode('utf-8'))
+
+# Parent side
+
+class _Worker:
+    def __init__(self, memory_limit, max_jobs):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker',
+             str(memory_limit), str(max_jobs)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.max_jobs = max_jobs
+        self.jobs = 0
+
+    def run(self, data, timeout):
+        self.jobs += 1
+        limits = json.dumps({'max_pages': MAX_PAGES, 'max_chars': MAX_TEXT_CHARS}).encode('utf-8')
+        _write_frames(self.process.stdin, limits, data)
+        return _read_reply(self.process.stdout.fileno(), time.monotonic() + timeout, MAX_TEXT_CHARS)
+
+    def usable(self):
+        return self.jobs < self.max_jobs and self.process.poll() is None
+
+    def close(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                # The worker exits on EOF (or on its own after max_jobs)
+                self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            for stream in (self.process.stdin, self.process.stdout):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+class PdfSandbox:
+    """
+    A small pool of PDF extraction processes.
+
+    At most `size` documents are extracted at once; a job that runs past
+    `timeout` has its worker killed, and a worker that hits its memory
+    limit only fails its own job. Workers are started on demand and
+    replaced after `max_jobs` jobs.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=JOB_TIMEOUT, memory_limit_mb=MEMORY_LIMIT_MB,
+                 max_jobs=MAX_JOBS_PER_WORKER):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.max_jobs = max_jobs
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def extract(self, data):
+        """
+        Extract the text of a PDF in a worker process.
+
+        Args:
+            data (bytes): The PDF file contents
+
+        Returns:
+            str: The extracted text
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PdfExtractionError("PDF extraction is busy, try again shortly")
+        try:
+            worker = self._checkout()
+            try:
+                status, value = worker.run(data, self.timeout)
+            except TimeoutError:
+                logger.warning(f"PDF extraction exceeded {self.timeout}s, killing worker")
+                worker.close(kill=True)
+                raise PdfExtractionError("PDF took too long to process")
+            except (EOFError, OSError, ValueError) as e:
+                # Crashed (e.g. killed for exceeding its memory limit) or sent a garbled reply
+                logger.warning(f"PDF extraction worker died: {str(e) or type(e).__name__}")
+                worker.close(kill=True)
+                raise PdfExtractionError("PDF could not be processed")
+            self._checkin(worker)
+            if status != 'ok':
+                raise PdfExtractionError(value)
+            return value
+        finally:
+            self._slots.release()
+
+    def _checkout(self):
+        # Workers belong to the process that started them (e.g. one gunicorn worker)
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return _Worker(self.memory_limit, self.max_jobs)
+            if worker.usable():
+                return worker
+            worker.close()
+
+    def _checkin(self, worker):
+        if worker.usable():
+            self._idle.put(worker)
+        else:
+            logger.info(f"Recycling PDF extraction worker after {worker.jobs} jobs")
+            worker.close()
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# Shared pool used by pdf_loader
+sandbox = PdfSandbox()
+atexit.register(sandbox.shutdown)
+
+if __name__ == "__main__" and len(sys.argv) == 4 and sys.argv[1] == '--worker':
+    _worker_main(int(sys.argv[2]), int(sys.argv[3]))
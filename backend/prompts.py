@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+import logging
+
+from session_store import estimate_tokens
+from metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever SYSTEM_PROMPT changes so cached prefixes are rebuilt
+PROMPT_VERSION = "1"
+MAX_CACHED_PREFIXES = 8
+
+SYSTEM_PROMPT = """
+You are Deha AI, a compassionate and knowledgeable medical case manager.
+Your primary responsibility is to assist the individual in understanding and managing their health based on their provided medical record.
+You should engage in a continuous conversation, answering questions directly and providing relevant information and guidance derived *only* from the medical data.
+
+Maintain a warm, empathetic, and encouraging tone throughout the conversation.
+Explain medical terms and concepts in a clear and accessible way, avoiding jargon where possible.
+When responding to questions, always consider the specific conditions, medications, and recent lab results presented in the medical record.
+
+Instead of simply stating facts, weave them into your responses naturally as part of the ongoing dialogue.
+Offer practical advice and considerations tailored to the individual's situation.
+For example, when discussing diet or exercise, highlight aspects relevant to their conditions, cholesterol levels, and blood pressure.
+Encourage them to take an active role in their health management and always suggest consulting their doctor for any significant changes or concerns.
+
+Avoid explicitly stating that you are 'thinking' or outlining your internal reasoning steps.
+Your responses should flow naturally as if you are genuinely engaged in a conversation.
+
+Your goal is to make the individual feel supported, informed, and empowered in managing their health.
+"""
+
+# Used by the post-upload warm-up to condense a record into a smaller prompt context
+SUMMARY_PROMPT = """
+Summarize the following medical record for a medical assistant who will answer the patient's questions from your summary alone.
+Keep every current medication with its dose and schedule, the most recent lab values with their dates, all diagnoses, allergies and upcoming appointments with dates and times.
+Use short bullet points, no commentary.
+"""
+
+class PromptPrefix(NamedTuple):
+    """The assembled system message shared by every turn on one document."""
+    text: str
+    tokens: int
+    doc_version: str
+    prompt_version: str
+
+_prefix_cache = OrderedDict()
+_prefix_lock = threading.Lock()
+
+def document_version(text):
+    """
+    Compute a short, stable version ID for a medical record.
+
+    Call this once when the record is loaded, not per request.
+
+    Args:
+        text (str): The medical record text
+
+    Returns:
+        str: Hex digest identifying this exact text
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def get_prefix(record_text, doc_version=None):
+    """
+    Return the system prompt + medical record prefix, assembled once per version.
+
+    Every endpoint goes through here so they all send byte-identical prefixes,
+    which lets the provider reuse its prompt cache across endpoints and turns.
+
+    Args:
+        record_text (str): The medical record text
+        doc_version (str): Version from document_version(); computed if omitted
+
+    Returns:
+        PromptPrefix: The cached prefix and its token count
+    """
+    if doc_version is None:
+        doc_version = document_version(record_text)
+    key = (doc_version, PROMPT_VERSION)
+
+    with _prefix_lock:
+        prefix = _prefix_cache.get(key)
+        if prefix is not None:
+            _prefix_cache.move_to_end(key)
+            cache_requests.inc(cache='prompt_prefix', result='hit')
+            return prefix
+
+    cache_requests.inc(cache='prompt_prefix', result='miss')
+    text = f"{SYSTEM_PROMPT}\n\nMedical Record:\n{record_text}"
+    prefix = PromptPrefix(text, estimate_tokens(text), doc_version, PROMPT_VERSION)
+    logger.info("Built prompt prefix for document %s (~%d tokens)", doc_version, prefix.tokens)
+
+    with _prefix_lock:
+        _prefix_cache[key] = prefix
+        while len(_prefix_cache) > MAX_CACHED_PREFIXES:
+            _prefix_cache.popitem(last=False)
+    return prefix
+
+def summary_prefix(summary, doc_version):
+    """
+    Build the system prompt + record summary prefix used in place of the full record.
+
+    Args:
+        summary (str): Summary generated from SUMMARY_PROMPT
+        doc_version (str): Version of the record it summarizes
+
+    Returns:
+        PromptPrefix: The prefix and its token count
+    """
+    text = f"{SYSTEM_PROMPT}\n\nMedical Record Summary:\n{summary}"
+    return PromptPrefix(text, estimate_tokens(text), doc_version, PROMPT_VERSION)
@@ -5,6 +5,16 @@ from pinecone import Pinecone, ServerlessSpec
 import json
 from typing import List, Dict
 import logging
+import numpy as np
+from model_router import route_query
+from single_flight import groq_chat_flight, groq_embeddings_flight, request_key
+from scheduler import scheduler, PRIORITY_CHAT, PRIORITY_BACKGROUND
+from metrics import span, record_usage
+from session_store import estimate_tokens
+from shard_map import ShardMap
+from chunk_store import ChunkStore, chunk_spans, document_id
+from vector_index import LocalVectorIndex
+from fact_table import fact_tables
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,23 +24,38 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Initialize clients
-groq_client = groq.Client(api_key=os.getenv("GROQ_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+# No SDK retries: the scheduler handles 429s and backoff
+groq_client = groq.Client(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), host=os.getenv("PINECONE_CONTROLLER_HOST"))
 
 # Constants
 INDEX_NAME = "medical-records"
 NAMESPACE = "patient-records"
 EMBEDDING_MODEL = "llama2-70b-4096"
+EMBEDDING_DIMENSION = 4096
 CHUNK_SIZE = 512
+UPSERT_BATCH_SIZE = 100
+LEGACY_SCAN_BATCH = 1000  # IDs fetched per query when finding vectors written before sharding
+LEGACY_DELETE_PASSES = 20  # Upper bound on query-then-delete rounds for one pre-sharding patient
+# "pinecone", or "local" for the in-process quantized index (int8/float16 with full-precision re-scoring)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "pinecone")
+
+# Which namespace (shard) each patient's vectors live in
+shards = ShardMap(NAMESPACE)
+# Chunk text is stored once per document; vector metadata only holds offsets into it
+chunk_store = ChunkStore()
+local_index = LocalVectorIndex(dimension=EMBEDDING_DIMENSION) if VECTOR_BACKEND == "local" else None
 
 def create_index():
     """Create Pinecone index if it doesn't exist"""
+    if local_index is not None:
+        return local_index
     try:
         # Check if index exists
         if INDEX_NAME not in pc.list_indexes().names():
             pc.create_index(
                 name=INDEX_NAME,
-                dimension=4096,  # Dimension for llama2 embeddings
+                dimension=EMBEDDING_DIMENSION,  # Dimension for llama2 embeddings
                 metric="cosine",
                 spec=ServerlessSpec(
                     cloud="aws",
@@ -43,6 +68,14 @@ def create_index():
         logger.error(f"Error creating index: {str(e)}")
         raise
 
+def legacy_vector_ids(index, patient_id: str, limit: int = LEGACY_SCAN_BATCH) -> List[str]:
+    """IDs of a patient's vectors in the shared pre-sharding namespace (at most `limit`)"""
+    # A filtered query is the one ID lookup both Pinecone serverless and the local index support
+    results = scheduler.call('pinecone', lambda: index.query(
+        vector=[1.0] * EMBEDDING_DIMENSION, top_k=limit, namespace=NAMESPACE,
+        filter={"patient_id": patient_id}, include_metadata=False))
+    return [match.id for match in results.matches]
+
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE) -> List[str]:
     """Split text into chunks of specified size"""
     words = text.split()
@@ -64,12 +97,16 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE) -> List[str]:
     
     return chunks
 
-def get_embeddings(text: str) -> List[float]:
-    """Get embeddings from Groq"""
+def get_embeddings(text: str, priority: int = PRIORITY_CHAT) -> List[float]:
+    """Get embeddings from Groq, sharing identical concurrent requests"""
+    def _embed():
+        with span('embeddings'):
+            return groq_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+
     try:
-        response = groq_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text
+        response = groq_embeddings_flight.do(
+            request_key('embeddings', EMBEDDING_MODEL, text),
+            lambda: scheduler.call('groq', _embed, priority=priority, tokens=len(text) // 4 + 1)
         )
         return response.data[0].embedding
     except Exception as e:
@@ -79,70 +116,102 @@ def get_embeddings(text: str) -> List[float]:
 def process_document(file_path: str, patient_id: str) -> None:
     """Process a document and store in Pinecone"""
     try:
-        # Read document (dummy implementation)
+        # Read document (dummy implementation) and store its text once
         with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+            data = f.read().encode('utf-8')
+        doc_id = document_id(patient_id, data)
+        chunk_store.put(doc_id, data)
+        fact_tables.build(patient_id, data.decode('utf-8'))
         
-        # Chunk the text
-        chunks = chunk_text(text)
-        logger.info(f"Split document into {len(chunks)} chunks")
+        # Chunk the text by byte offsets
+        spans = chunk_spans(data, CHUNK_SIZE)
+        logger.info(f"Split document into {len(spans)} chunks")
         
-        # Get index
+        # Get index and this patient's shard
         index = create_index()
+        namespace = shards.namespace_for(patient_id)
+        if shards.get(patient_id) is None and legacy_vector_ids(index, patient_id, limit=1):
+            # Ingested before sharding: keep all of the patient's vectors in the shared namespace
+            namespace = NAMESPACE
         
-        # Process each chunk
-        for i, chunk in enumerate(chunks):
-            # Get embeddings
-            embedding = get_embeddings(chunk)
-            
-            # Create metadata
-            metadata = {
-                "patient_id": patient_id,
-                "chunk_id": i,
-                "text": chunk,
-                "source": file_path
-            }
-            
-            # Upsert to Pinecone
-            index.upsert(
-                vectors=[{
-                    "id": f"{patient_id}_{i}",
-                    "values": embedding,
-                    "metadata": metadata
-                }],
-                namespace=NAMESPACE
-            )
+        # Embeddings go into one contiguous float32 array (ingestion yields to interactive traffic)
+        embeddings = np.empty((len(spans), EMBEDDING_DIMENSION), dtype=np.float32)
+        for i, (start, end) in enumerate(spans):
+            embeddings[i] = get_embeddings(chunk_store.read(doc_id, start, end), priority=PRIORITY_BACKGROUND)
+        
+        # Upsert in batches; metadata carries offsets into the chunk store, not the text.
+        # IDs are per document so a patient's documents don't overwrite each other.
+        vector_ids = [f"{doc_id}_{i}" for i in range(len(spans))]
+        for batch_start in range(0, len(spans), UPSERT_BATCH_SIZE):
+            batch = [{
+                "id": vector_ids[i],
+                # The local index quantizes arrays itself; Pinecone's client wants lists
+                "values": embeddings[i] if local_index is not None else embeddings[i].tolist(),
+                "metadata": {
+                    "patient_id": patient_id,
+                    "chunk_id": i,
+                    "doc_id": doc_id,
+                    "start": spans[i][0],
+                    "end": spans[i][1],
+                    "source": file_path
+                }
+            } for i in range(batch_start, min(batch_start + UPSERT_BATCH_SIZE, len(spans)))]
+            with span('vector_upsert'):
+                scheduler.call(
+                    'pinecone',
+                    lambda: index.upsert(vectors=batch, namespace=namespace),
+                    priority=PRIORITY_BACKGROUND
+                )
+        previous = ((shards.get(patient_id) or {}).get("source_documents") or {}).get(file_path)
+        shards.record(patient_id, namespace, vector_ids, file_path, doc_id=doc_id)
+        if previous and previous != doc_id:
+            # The source changed since it was last ingested: retire the old version
+            stale = shards.drop_document(patient_id, previous)
+            for start in range(0, len(stale), UPSERT_BATCH_SIZE):
+                batch_ids = stale[start:start + UPSERT_BATCH_SIZE]
+                scheduler.call('pinecone', lambda: index.delete(ids=batch_ids, namespace=namespace),
+                               priority=PRIORITY_BACKGROUND)
+            chunk_store.delete(previous)
+            logger.info(f"Replaced {len(stale)} vectors from the previous version of {file_path}")
         
-        logger.info(f"Successfully processed document for patient {patient_id}")
+        logger.info(f"Successfully processed document for patient {patient_id} into {namespace}")
         
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}")
         raise
 
+def chunk_text_for(metadata: Dict) -> str:
+    """Read a match's chunk text from the chunk store (older vectors carry it inline)"""
+    if "text" in metadata:
+        return metadata["text"]
+    return chunk_store.read(metadata["doc_id"], int(metadata["start"]), int(metadata["end"]))
+
 def query_records(patient_id: str, query: str, top_k: int = 3) -> List[Dict]:
     """Query patient records using RAG"""
     try:
         # Get query embedding
         query_embedding = get_embeddings(query)
         
-        # Get index
+        # Get index and this patient's shard
         index = create_index()
+        namespace = shards.read_namespace(patient_id)
+        query_args = {"vector": query_embedding, "top_k": top_k, "namespace": namespace,
+                      "include_metadata": True}
+        if shards.needs_filter(namespace):
+            query_args["filter"] = {"patient_id": patient_id}
         
         # Query Pinecone
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            namespace=NAMESPACE,
-            filter={"patient_id": patient_id}
-        )
+        with span('vector_query'):
+            results = scheduler.call('pinecone', lambda: index.query(**query_args))
         
         # Format results
         formatted_results = []
         for match in results.matches:
+            metadata = match.metadata
             formatted_results.append({
-                "text": match.metadata["text"],
+                "text": chunk_text_for(metadata),
                 "score": match.score,
-                "source": match.metadata["source"]
+                "source": metadata["source"]
             })
         
         return formatted_results
@@ -151,6 +220,87 @@ def query_records(patient_id: str, query: str, top_k: int = 3) -> List[Dict]:
         logger.error(f"Error querying records: {str(e)}")
         raise
 
+def delete_patient(patient_id: str) -> None:
+    """Delete all of a patient's vectors and forget their shard entry"""
+    try:
+        entry = shards.get(patient_id)
+        index = create_index()
+        if entry is None:
+            # Not in the shard map: any vectors predate sharding and sit in the shared namespace.
+            # Queries may keep returning deleted IDs until Pinecone catches up, so only new IDs
+            # are deleted and the number of rounds is capped.
+            deleted = set()
+            with span('vector_delete'):
+                for _ in range(LEGACY_DELETE_PASSES):
+                    ids = [i for i in legacy_vector_ids(index, patient_id) if i not in deleted]
+                    if not ids:
+                        break
+                    scheduler.call('pinecone', lambda: index.delete(ids=ids, namespace=NAMESPACE),
+                                   priority=PRIORITY_BACKGROUND)
+                    deleted.update(ids)
+                else:
+                    logger.warning(f"Stopped deleting pre-sharding vectors for patient {patient_id} after "
+                                   f"{LEGACY_DELETE_PASSES} rounds; some may remain")
+            logger.info(f"Deleted {len(deleted)} pre-sharding vectors for patient {patient_id}")
+            return
+        
+        namespace = entry["namespace"]
+        with span('vector_delete'):
+            if not shards.needs_filter(namespace):
+                # The namespace belongs to this patient alone
+                scheduler.call('pinecone', lambda: index.delete(delete_all=True, namespace=namespace),
+                               priority=PRIORITY_BACKGROUND)
+            else:
+                ids = entry["vector_ids"]
+                for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+                    batch = ids[start:start + UPSERT_BATCH_SIZE]
+                    scheduler.call('pinecone', lambda: index.delete(ids=batch, namespace=namespace),
+                                   priority=PRIORITY_BACKGROUND)
+        shards.forget(patient_id)
+        for doc_id in entry.get("documents", []):
+            chunk_store.delete(doc_id)
+        logger.info(f"Deleted vectors for patient {patient_id} from {namespace}")
+        
+    except Exception as e:
+        logger.error(f"Error deleting patient {patient_id}: {str(e)}")
+        raise
+
+def delete_shard(namespace: str) -> List[str]:
+    """Drop a whole shard and every patient mapped to it; returns those patient IDs"""
+    try:
+        index = create_index()
+        with span('vector_delete'):
+            scheduler.call('pinecone', lambda: index.delete(delete_all=True, namespace=namespace),
+                           priority=PRIORITY_BACKGROUND)
+        patients = shards.patients_in(namespace)
+        for patient_id in patients:
+            entry = shards.forget(patient_id)
+            for doc_id in entry.get("documents", []):
+                chunk_store.delete(doc_id)
+        logger.info(f"Deleted shard {namespace} ({len(patients)} patients)")
+        return patients
+        
+    except Exception as e:
+        logger.error(f"Error deleting shard {namespace}: {str(e)}")
+        raise
+
+def rebuild_patient(patient_id: str) -> None:
+    """Re-ingest a patient's recorded source documents into a fresh shard"""
+    entry = shards.get(patient_id)
+    if entry is None:
+        raise ValueError(f"No shard entry for patient {patient_id}")
+    delete_patient(patient_id)
+    for source in entry["sources"]:
+        process_document(source, patient_id)
+
+def rebuild_shard(namespace: str) -> None:
+    """Re-ingest every patient in a shard from their recorded source documents"""
+    sources = {patient_id: shards.get(patient_id)["sources"] for patient_id in shards.patients_in(namespace)}
+    delete_shard(namespace)
+    for patient_id, paths in sources.items():
+        for source in paths:
+            process_document(source, patient_id)
+
 def generate_response(query: str, context: List[Dict]) -> str:
     """Generate response using Groq"""
     try:
@@ -168,12 +318,25 @@ def generate_response(query: str, context: List[Dict]) -> str:
 
         Answer:"""
         
-        # Get response from Groq
-        response = groq_client.chat.completions.create(
-            model="llama2-70b-4096",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500
+        # Get response from Groq, sized to the kind of question
+        route = route_query(query)
+        request = {
+            "model": route.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+            "max_tokens": route.max_tokens,
+        }
+        def _complete():
+            with span('llm'):
+                response = groq_client.chat.completions.create(**request)
+            record_usage('groq', route.model, response)
+            return response
+        
+        # Shares identical concurrent requests and waits for admission under Groq's rate limits
+        response = groq_chat_flight.do(
+            request_key('chat', request),
+            lambda: scheduler.call('groq', _complete, priority=PRIORITY_CHAT,
+                                   tokens=estimate_tokens(prompt) + route.max_tokens)
         )
         
         return response.choices[0].message.content
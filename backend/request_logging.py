@@ -0,0 +1,115 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from flask import g, request
+
+logger = logging.getLogger('deha.requests')
+
+# Fraction of requests logged per route prefix; anything unlisted uses DEFAULT_SAMPLE_RATE
+ROUTE_SAMPLE_RATES = {
+    '/chat': 1.0,
+    '/voice': 1.0,
+    '/listen': 1.0,
+    '/upload': 1.0,
+    '/tts': 1.0,
+    '/test': 0.1,
+}
+DEFAULT_SAMPLE_RATE = 1.0
+
+# JSON body fields are logged only as field names and value sizes, never values,
+# and only when the body is at most this many bytes
+MAX_LOGGED_BODY = 4096
+
+_listener = None
+
+def configure_logging(level=None):
+    """
+    Route all logging through a queue so request threads never block on I/O.
+
+    Records are put on an in-memory queue by a QueueHandler and written to
+    stderr by a background QueueListener thread.
+
+    Args:
+        level (str): Root log level, defaults to the LOG_LEVEL env var or INFO
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    # Forked workers (e.g. gunicorn with preload) don't inherit the listener thread
+    os.register_at_fork(after_in_child=_restart_listener)
+
+def _restart_listener():
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+def _sample_rate(path):
+    for prefix, rate in ROUTE_SAMPLE_RATES.items():
+        if path == prefix or path.startswith(prefix + '/'):
+            return rate
+    return DEFAULT_SAMPLE_RATE
+
+def _body_shape():
+    """Describe a small JSON body by field name and size, without its contents."""
+    if not request.is_json or (request.content_length or 0) > MAX_LOGGED_BODY:
+        return None
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return type(data).__name__
+    return {key: f"<{type(value).__name__} len={len(value) if hasattr(value, '__len__') else '-'}>"
+            for key, value in data.items()}
+
+def init_request_logging(app, skip_endpoints=()):
+    """
+    Install size-capped, sampled, redacted request/response logging on an app.
+
+    Uploads are described by content length and type only; their bodies are
+    never read here, so PDF and audio uploads are not buffered for logging.
+
+    Args:
+        app (Flask): The application
+        skip_endpoints (iterable): Endpoint names that are never logged
+    """
+    skip_endpoints = set(skip_endpoints)
+
+    @app.before_request
+    def log_request_info():
+        g.request_start = time.perf_counter()
+        g.log_request = (request.endpoint not in skip_endpoints
+                         and random.random() < _sample_rate(request.path))
+        if not g.log_request:
+            return
+        logger.info('%s %s len=%s type=%s', request.method, request.path,
+                    request.content_length, request.mimetype or '-')
+        if logger.isEnabledFor(logging.DEBUG):
+            shape = _body_shape()
+            if shape is not None:
+                logger.debug('%s %s body=%s', request.method, request.path, shape)
+
+    @app.after_request
+    def log_response_info(response):
+        if getattr(g, 'log_request', False):
+            elapsed_ms = (time.perf_counter() - g.request_start) * 1000
+            logger.info('%s %s -> %d %s len=%s %.1fms', request.method, request.path,
+                        response.status_code, response.mimetype or '-',
+                        response.content_length, elapsed_ms)
+        return response
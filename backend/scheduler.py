@@ -0,0 +1,200 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import logging
+from metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower runs first
+PRIORITY_VOICE = 0       # Interactive voice turns
+PRIORITY_CHAT = 1        # Text chat
+PRIORITY_BACKGROUND = 2  # Ingestion, warm-up and other batch work
+
+# Defaults for queueing and retries
+MAX_QUEUE_WAIT = 30.0    # Seconds a request may wait for admission in total
+MAX_RETRIES = 3          # Retries after a 429 from the provider
+BACKOFF_BASE = 1.0       # Seconds, doubled per retry when no Retry-After is given
+
+class UpstreamBusy(Exception):
+    """Raised when a request could not be admitted within its wait budget."""
+
+class TokenBucket:
+    """A per-minute quota that refills continuously."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken (0 if it can be taken now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+class _Provider:
+    """Quota state and admission queue for one upstream provider."""
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.waiting = []
+        self.blocked_until = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+
+def _rate_limit_info(error):
+    """
+    Pull the HTTP status and Retry-After (seconds) out of an SDK exception.
+
+    Groq, ElevenLabs and Pinecone errors expose these in slightly different
+    places, so look in the usual spots.
+    """
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    response = getattr(error, 'response', None)
+    headers = getattr(error, 'headers', None) or {}
+    if response is not None:
+        status = status or getattr(response, 'status_code', None)
+        headers = getattr(response, 'headers', None) or headers
+    retry_after = None
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        if value is not None:
+            retry_after = float(value)
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return status, retry_after
+
+class UpstreamScheduler:
+    """
+    Admit upstream calls according to per-provider rate limits.
+
+    Each provider has a requests/min bucket and an optional tokens/min bucket.
+    Callers queue in priority order (voice before chat before background work)
+    and are admitted when the buckets allow, instead of failing on a 429.
+    When the provider does return a 429, the whole provider backs off for its
+    Retry-After and the call is retried.
+    """
+
+    def __init__(self):
+        self._providers = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def register(self, name, requests_per_minute, tokens_per_minute=None):
+        """Register (or replace) the quotas for a provider."""
+        with self._cond:
+            self._providers[name] = _Provider(name, requests_per_minute, tokens_per_minute)
+
+    def _admit(self, provider, priority, tokens, deadline):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(provider.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = None
+                    if provider.waiting[0] == ticket:
+                        delay = max(provider.blocked_until - now,
+                                    provider.requests.wait_time(1, now),
+                                    provider.tokens.wait_time(tokens, now) if provider.tokens else 0.0)
+                        if delay <= 0:
+                            provider.requests.take(1)
+                            if provider.tokens:
+                                provider.tokens.take(tokens)
+                            provider.admitted += 1
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise UpstreamBusy(f"{provider.name} is over its rate limit, try again shortly")
+                    self._cond.wait(min(delay, remaining) if delay is not None else remaining)
+            finally:
+                provider.waiting.remove(ticket)
+                heapq.heapify(provider.waiting)
+                self._cond.notify_all()
+
+    def call(self, name, fn, priority=PRIORITY_CHAT, tokens=0, max_wait=MAX_QUEUE_WAIT,
+             max_retries=MAX_RETRIES):
+        """
+        Run fn() once the provider's quota admits it, retrying on 429s.
+
+        Args:
+            name (str): Registered provider name
+            fn (callable): Zero-argument function performing the upstream call
+            priority (int): One of the PRIORITY_* lanes
+            tokens (int): Estimated tokens this call consumes
+            max_wait (float): Seconds to wait for admission across all attempts
+            max_retries (int): Retries after a rate-limit response
+
+        Returns:
+            The result of fn()
+        """
+        provider = self._providers.get(name)
+        if provider is None:
+            return fn()
+
+        deadline = time.monotonic() + max_wait
+        for attempt in range(max_retries + 1):
+            self._admit(provider, priority, tokens, deadline)
+            try:
+                return fn()
+            except Exception as e:
+                status, retry_after = _rate_limit_info(e)
+                if status != 429 or attempt == max_retries:
+                    raise
+                delay = retry_after or BACKOFF_BASE * (2 ** attempt) * (1 + random.random())
+                logger.warning("%s returned 429, backing off %.1fs (attempt %d/%d)",
+                               name, delay, attempt + 1, max_retries)
+                with self._cond:
+                    provider.rate_limited += 1
+                    provider.blocked_until = max(provider.blocked_until, time.monotonic() + delay)
+                    self._cond.notify_all()
+
+    def stats(self):
+        """Return queue depth and counters per provider."""
+        with self._cond:
+            return {
+                name: {
+                    'queued': len(p.waiting),
+                    'admitted': p.admitted,
+                    'rate_limited': p.rate_limited,
+                }
+                for name, p in self._providers.items()
+            }
+
+@register_collector
+def _scheduler_metrics():
+    stats = scheduler.stats()
+    lines = []
+    for field, kind, help_text in (('queued', 'gauge', 'Upstream calls waiting for admission'),
+                                   ('admitted', 'counter', 'Upstream calls admitted'),
+                                   ('rate_limited', 'counter', 'Upstream 429 responses')):
+        name = f"deha_upstream_{field}" + ('_total' if kind == 'counter' else '')
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for provider, values in stats.items():
+            lines.append(f'{name}{{provider="{provider}"}} {values[field]}')
+    return lines
+
+# Shared scheduler with quotas from the environment
+scheduler = UpstreamScheduler()
+scheduler.register('groq', int(os.getenv('GROQ_RPM', '30')), int(os.getenv('GROQ_TPM', '6000')))
+scheduler.register('groq_audio', int(os.getenv('GROQ_AUDIO_RPM', '20')))
+scheduler.register('elevenlabs', int(os.getenv('ELEVENLABS_RPM', '60')),
+                   int(os.getenv('ELEVENLABS_CHARS_PER_MIN', '0')) or None)
+scheduler.register('pinecone', int(os.getenv('PINECONE_RPM', '100')))
@@ -0,0 +1,112 @@
+"""
+Production entry point for the Deha AI backend.
+
+    python serve.py --threads 16 --bind 0.0.0.0:5000
+
+Runs the Flask app under gunicorn with the app preloaded in the master.
+The app keeps its state in process memory (the loaded record, sessions,
+fact tables, warm-up caches, batch jobs and the upstream rate-limit
+buckets), so it runs a single worker by default and scales with threads:
+requests mostly wait on upstream APIs. More workers only make sense
+behind a load balancer with sticky sessions, and each worker then gets
+its own copy of the upstream quotas. On SIGTERM each worker reports not-ready on /readyz but keeps
+accepting connections for --drain-delay seconds, so load balancers see the
+503 and stop routing to it. Then it stops accepting and finishes in-flight
+requests. The delay counts towards --graceful-timeout. Every option can
+also be set with the matching DEHA_* env var.
+"""
+import argparse
+import os
+import signal
+import threading
+import logging
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+def _env(name, default):
+    return os.getenv(f"DEHA_{name}", default)
+
+# Seconds a worker keeps serving (with /readyz at 503) after SIGTERM before it stops accepting
+drain_delay = float(_env('DRAIN_DELAY', 5))
+
+def set_drain_delay(seconds):
+    global drain_delay
+    drain_delay = seconds
+
+def post_worker_init(worker):
+    """Flip readiness to draining as soon as a worker is asked to stop, then stop after drain_delay."""
+    from main import draining
+
+    original = signal.getsignal(signal.SIGTERM)
+
+    def on_sigterm(signum, frame):
+        if draining.is_set() or not callable(original):
+            return
+        draining.set()
+        # gunicorn's handler closes the listeners at once, which would hide /readyz from probes
+        timer = threading.Timer(drain_delay, original, args=(signum, None))
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+def when_ready(server):
+    logger.info("Deha AI serving on %s with %d workers x %d threads",
+                ', '.join(str(listener) for listener in server.LISTENERS),
+                server.cfg.workers, server.cfg.threads)
+
+class DehaApplication(BaseApplication):
+    """Embedded gunicorn application serving main.app."""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Deha AI backend in production")
+    parser.add_argument('--bind', default=_env('BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(_env('WORKERS', 1)),
+                        help="Worker processes; state is per process, so keep 1 unless requests are sticky")
+    parser.add_argument('--threads', type=int, default=int(_env('THREADS', 16)),
+                        help="Threads per worker; requests mostly wait on upstream APIs")
+    parser.add_argument('--timeout', type=int, default=int(_env('TIMEOUT', 120)),
+                        help="Seconds before a silent worker is killed and restarted")
+    parser.add_argument('--graceful-timeout', type=int, default=int(_env('GRACEFUL_TIMEOUT', 30)),
+                        help="Seconds to finish in-flight requests after SIGTERM")
+    parser.add_argument('--drain-delay', type=float, default=drain_delay,
+                        help="Seconds to keep serving with /readyz at 503 after SIGTERM (part of the graceful timeout)")
+    parser.add_argument('--max-requests', type=int, default=int(_env('MAX_REQUESTS', 0)),
+                        help="Recycle a worker after this many requests (0 = never); recycling drops in-memory state")
+    parser.add_argument('--no-preload', action='store_true', help="Import the app in each worker instead")
+    args = parser.parse_args()
+    set_drain_delay(args.drain_delay)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': 5,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'preload_app': not args.no_preload,
+        'post_worker_init': post_worker_init,
+        'when_ready': when_ready,
+    }
+    DehaApplication(options).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_TURNS = 24                # Messages kept verbatim per session (ring capacity)
+HISTORY_TOKEN_BUDGET = 1500   # Tokens allowed for verbatim history + summary
+SUMMARY_TOKEN_BUDGET = 300    # Tokens allowed for the rolling summary of evicted turns
+SESSION_TTL = 60 * 60         # Seconds of inactivity before a session is dropped
+MAX_SESSIONS = 1000           # Sessions kept in memory before the least recent is evicted
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate used for budgeting (roughly 4 characters per token).
+
+    Args:
+        text (str): The text to measure
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+def summarize_turns(previous_summary, turns, budget=SUMMARY_TOKEN_BUDGET):
+    """
+    Fold evicted turns into the rolling summary without calling the LLM.
+
+    Keeps the first sentence of every evicted message and drops the oldest
+    lines once the summary goes over its token budget.
+
+    Args:
+        previous_summary (str): The current summary, may be empty
+        turns (list): Evicted (role, content, tokens) tuples, oldest first
+        budget (int): Token budget for the resulting summary
+
+    Returns:
+        str: The updated summary
+    """
+    lines = previous_summary.split('\n') if previous_summary else []
+    for role, content, _ in turns:
+        first_sentence = content.strip().split('\n')[0]
+        for sep in ('. ', '? ', '! '):
+            if sep in first_sentence:
+                first_sentence = first_sentence.split(sep)[0] + sep.strip()
+                break
+        speaker = 'Patient' if role == 'user' else 'Deha AI'
+        lines.append(f"- {speaker}: {first_sentence[:200]}")
+
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > budget:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+class Session:
+    """Conversation state for one session: a ring of recent turns plus a summary."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = deque()
+        self.summary = ''
+        self.history_tokens = 0
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _append(self, role, content):
+        tokens = estimate_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.history_tokens += tokens
+
+    def _compact(self, max_turns, token_budget):
+        """Evict the oldest turns (in user/assistant pairs) into the summary."""
+        evicted = []
+        while self.turns and (
+            len(self.turns) > max_turns
+            or self.history_tokens + estimate_tokens(self.summary) > token_budget
+        ):
+            for _ in range(2):
+                if not self.turns:
+                    break
+                turn = self.turns.popleft()
+                self.history_tokens -= turn[2]
+                evicted.append(turn)
+            # Never split a pair: history always starts with a user turn
+            if self.turns and self.turns[0][0] != 'user':
+                turn = self.turns.popleft()
+                self.history_tokens -= turn[2]
+                evicted.append(turn)
+            if len(self.turns) == 0:
+                break
+        if evicted:
+            self.summary = summarize_turns(self.summary, evicted)
+            logger.debug("Compacted %d turns for session %s", len(evicted), self.session_id)
+
+class SessionStore:
+    """
+    In-memory store of conversation sessions with a per-session token budget.
+
+    The stable prefix (system prompt + medical record) is passed in by the caller
+    and always sent first and unchanged, so provider-side prompt caching keeps
+    hitting across turns. History follows it: an optional summary of evicted
+    turns, then the most recent turns verbatim.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def new_session_id(self):
+        return uuid.uuid4().hex
+
+    def _get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            # Drop expired sessions from the least recently used end
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_seen <= self.ttl and len(self._sessions) < self.max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def build_messages(self, session_id, system_prefix, user_message):
+        """
+        Build the chat messages for the next turn of a session.
+
+        Args:
+            session_id (str): The conversation session ID
+            system_prefix (str): The stable system prompt + medical record
+            user_message (str): The new user message
+
+        Returns:
+            list: Messages ready to send to the chat completion API
+        """
+        messages = [{"role": "system", "content": system_prefix}]
+        session = self._get(session_id)
+        with session.lock:
+            if session.summary:
+                messages.append({
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{session.summary}"
+                })
+            for role, content, _ in session.turns:
+                messages.append({"role": role, "content": content})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def record_turn(self, session_id, user_message, assistant_message):
+        """
+        Store a completed exchange and compact the session to its budget.
+
+        Args:
+            session_id (str): The conversation session ID
+            user_message (str): What the user said
+            assistant_message (str): What Deha AI answered
+        """
+        session = self._get(session_id)
+        with session.lock:
+            session._append('user', user_message)
+            session._append('assistant', assistant_message)
+            session._compact(self.max_turns, self.token_budget)
+
+    def has_history(self, session_id):
+        """True if the session has any earlier turns; doesn't create or refresh it."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        with session.lock:
+            return bool(session.turns or session.summary)
+
+    def clear(self, session_id):
+        """Forget a session entirely."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+# Shared store used by the Flask endpoints
+sessions = SessionStore()
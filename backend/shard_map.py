@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "patient": one namespace per patient (no metadata filter needed at query time)
+# "bucket": patients hashed into SHARD_BUCKETS namespaces, filtered by patient_id within a bucket
+SHARDING = os.getenv("RAG_SHARDING", "patient")
+SHARD_BUCKETS = int(os.getenv("RAG_SHARD_BUCKETS", "256"))
+# Patient data lives outside the repository, which the web server serves static files from
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.expanduser("~"), ".deha", "rag"))
+SHARD_MAP_PATH = os.getenv("RAG_SHARD_MAP", os.path.join(DATA_DIR, "shard_map.json"))
+# Rewrite the journal as a snapshot once it holds this many more lines than there are patients
+COMPACT_SLACK = 1000
+
+def _safe(value):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value))
+
+class ShardMap:
+    """
+    Persistent map of which namespace holds each patient's vectors.
+
+    Records the namespace, vector IDs, source documents and chunk store
+    document IDs per patient so a patient or a whole shard can be deleted
+    or rebuilt without scanning the index.
+
+    Saved next to the backend as a JSON-lines journal: each change appends
+    one line for one patient, so an ingest costs O(1) writes however many
+    patients exist, and the file is compacted into a snapshot now and then.
+
+    Patients with no entry predate sharding; their vectors are read from
+    the shared base namespace with a patient_id filter.
+    """
+
+    def __init__(self, base_namespace, path=SHARD_MAP_PATH, mode=SHARDING, buckets=SHARD_BUCKETS):
+        self.base_namespace = base_namespace
+        self.path = path
+        self.mode = mode
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._patients = {}
+        self._lines = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    change = json.loads(line)
+                    self._lines += 1
+                    if 'patients' in change:
+                        # Single-object snapshot written by earlier versions
+                        self._patients = change['patients']
+                    elif change.get('entry') is None:
+                        self._patients.pop(change['patient'], None)
+                    else:
+                        self._patients[change['patient']] = change['entry']
+            logger.info(f"Loaded shard map with {len(self._patients)} patients")
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read shard map {self.path}: {str(e)}")
+
+    def _append(self, patient_id, entry):
+        """Journal one patient's new entry (None when forgotten); call with the lock held."""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'patient': patient_id, 'entry': entry}) + '\n')
+        self._lines += 1
+        if self._lines > len(self._patients) + COMPACT_SLACK:
+            self._compact()
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for patient_id, entry in self._patients.items():
+                f.write(json.dumps({'patient': patient_id, 'entry': entry}) + '\n')
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._patients)
+
+    def read_namespace(self, patient_id):
+        """Return the namespace to query for a patient: their shard, or the base namespace if unmapped."""
+        with self._lock:
+            entry = self._patients.get(patient_id)
+        return entry['namespace'] if entry else self.base_namespace
+
+    def namespace_for(self, patient_id):
+        """Return the namespace new vectors for a patient go to (existing entries win)."""
+        with self._lock:
+            entry = self._patients.get(patient_id)
+        if entry:
+            return entry['namespace']
+        if self.mode == 'bucket':
+            bucket = zlib.crc32(str(patient_id).encode('utf-8')) % self.buckets
+            return f"{self.base_namespace}-b{bucket:03d}"
+        return f"{self.base_namespace}-p-{_safe(patient_id)}"
+
+    def needs_filter(self, namespace):
+        """True when a namespace is shared by several patients."""
+        return not namespace.startswith(f"{self.base_namespace}-p-")
+
+    def record(self, patient_id, namespace, vector_ids, source, doc_id=None):
+        """Remember vectors written for a patient from one source document."""
+        with self._lock:
+            entry = self._patients.setdefault(
+                patient_id, {'namespace': namespace, 'vector_ids': [], 'sources': []})
+            entry['vector_ids'] = sorted(set(entry['vector_ids']) | set(vector_ids))
+            if source not in entry['sources']:
+                entry['sources'].append(source)
+            documents = entry.setdefault('documents', [])
+            if doc_id is not None and doc_id not in documents:
+                documents.append(doc_id)
+            if doc_id is not None:
+                entry.setdefault('source_documents', {})[source] = doc_id
+            entry['updated'] = time.time()
+            self._append(patient_id, entry)
+
+    def drop_document(self, patient_id, doc_id):
+        """Forget one document's vectors (IDs are "<doc_id>_<chunk>"); returns the dropped IDs."""
+        with self._lock:
+            entry = self._patients.get(patient_id)
+            if entry is None:
+                return []
+            prefix = f"{doc_id}_"
+            dropped = [v for v in entry['vector_ids'] if v.startswith(prefix)]
+            entry['vector_ids'] = [v for v in entry['vector_ids'] if not v.startswith(prefix)]
+            entry['documents'] = [d for d in entry.get('documents', []) if d != doc_id]
+            entry['updated'] = time.time()
+            self._append(patient_id, entry)
+            return dropped
+
+    def get(self, patient_id):
+        with self._lock:
+            entry = self._patients.get(patient_id)
+            return dict(entry) if entry else None
+
+    def forget(self, patient_id):
+        with self._lock:
+            entry = self._patients.pop(patient_id, None)
+            if entry is not None:
+                self._append(patient_id, None)
+            return entry
+
+    def patients_in(self, namespace):
+        with self._lock:
+            return [p for p, entry in self._patients.items() if entry['namespace'] == namespace]
+
+    def namespaces(self):
+        """Return {namespace: patient count} for every known shard."""
+        counts = {}
+        with self._lock:
+            for entry in self._patients.values():
+                counts[entry['namespace']] = counts.get(entry['namespace'], 0) + 1
+        return counts
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import threading
+import logging
+from metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+def request_key(*parts):
+    """
+    Build a canonical key for an upstream request.
+
+    Args:
+        *parts: JSON-serializable pieces that fully describe the request
+            (endpoint name, model, messages, text, ...)
+
+    Returns:
+        str: A hex digest that is equal for identical requests
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _Call:
+    """One in-flight upstream call and the waiters sharing its result."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into a single upstream request.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is running wait and receive the same result (or the
+    same exception). Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn() for key, or wait for the identical call already in flight.
+
+        Args:
+            key (str): Canonical request key, see request_key()
+            fn (callable): Zero-argument function performing the upstream call
+
+        Returns:
+            The result of fn()
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.debug("Coalesced %s call onto in-flight request %s", self.name, key[:12])
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        """Return call, coalesced and in-flight counts for this group."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight),
+            }
+
+# One group per upstream so keys from different providers never collide
+groq_chat_flight = SingleFlight('groq_chat')
+groq_embeddings_flight = SingleFlight('groq_embeddings')
+elevenlabs_tts_flight = SingleFlight('elevenlabs_tts')
+
+FLIGHTS = [groq_chat_flight, groq_embeddings_flight, elevenlabs_tts_flight]
+
+def flight_stats():
+    """Return stats for every single-flight group, keyed by name."""
+    return {flight.name: flight.stats() for flight in FLIGHTS}
+
+@register_collector
+def _flight_metrics():
+    stats = flight_stats()
+    lines = []
+    for field, kind, help_text in (('calls', 'counter', 'Upstream calls requested'),
+                                   ('coalesced', 'counter', 'Upstream calls served by an identical in-flight call'),
+                                   ('in_flight', 'gauge', 'Upstream calls currently in flight')):
+        name = f"deha_singleflight_{field}" + ('_total' if kind == 'counter' else '')
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for group, values in stats.items():
+            lines.append(f'{name}{{group="{group}"}} {values[field]}')
+    return lines
@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import NamedTuple
+import logging
+from flask import Response, abort, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# The only files and directories (relative to the static root) ever served; everything
+# else under the root (backend source, .env, .git) is a 404
+STATIC_FILES = ['index.html', 'script.js', 'style.css']
+STATIC_DIRS = ['frontend/build']
+
+# Set STATIC_CACHE=0 to serve straight from disk (e.g. while editing assets)
+ENABLED = os.getenv('STATIC_CACHE', '1') != '0'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/manifest+json', 'application/xml')
+MIN_COMPRESS_BYTES = 512
+MAX_ASSET_BYTES = 5 * 1024 * 1024
+
+# Build-tool content hashes, e.g. main.3f2a9c1d.js or chunk.3f2a9c1d.chunk.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.(chunk\.)?[a-z0-9]+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+class StaticAsset(NamedTuple):
+    """One file with its precompressed variants, keyed by content-encoding ('' = identity)."""
+    mimetype: str
+    variants: dict
+    etags: dict
+    cache_control: str
+
+def _load_asset(path, rel_path):
+    with open(path, 'rb') as f:
+        body = f.read()
+    mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+    digest = hashlib.sha256(body).hexdigest()[:20]
+
+    variants = {'': body}
+    if len(body) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzipped) < len(body):
+            variants['gzip'] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                variants['br'] = compressed
+
+    etags = {encoding: f'"{digest}{"-" + encoding if encoding else ""}"' for encoding in variants}
+    cache_control = IMMUTABLE_CACHE if HASHED_NAME.search(os.path.basename(rel_path)) else REVALIDATE_CACHE
+    return StaticAsset(mimetype, variants, etags, cache_control)
+
+class StaticAssetCache:
+    """
+    In-memory static files with precomputed gzip/brotli variants and strong ETags.
+
+    Only STATIC_FILES and files under STATIC_DIRS are served. With the cache
+    disabled they are read from disk on each request instead.
+    """
+
+    def __init__(self, root, files=STATIC_FILES, dirs=STATIC_DIRS):
+        self.root = os.path.abspath(root)
+        self.files = set(files)
+        self.dirs = [directory.rstrip('/') + '/' for directory in dirs]
+        self.assets = {}
+        if ENABLED:
+            self._load(files, dirs)
+
+    def _allowed(self, rel_path):
+        if '..' in rel_path.split('/') or rel_path.startswith('/'):
+            return False
+        return rel_path in self.files or rel_path.startswith(tuple(self.dirs))
+
+    def _load(self, files, dirs):
+        rel_paths = list(files)
+        for directory in dirs:
+            base = os.path.join(self.root, directory)
+            for dirpath, _, filenames in os.walk(base):
+                for filename in filenames:
+                    rel_paths.append(os.path.relpath(os.path.join(dirpath, filename), self.root))
+
+        total = 0
+        for rel_path in rel_paths:
+            path = os.path.join(self.root, rel_path)
+            try:
+                if not os.path.isfile(path) or os.path.getsize(path) > MAX_ASSET_BYTES:
+                    continue
+                asset = _load_asset(path, rel_path)
+            except OSError as e:
+                logger.warning(f"Could not cache static file {rel_path}: {str(e)}")
+                continue
+            self.assets[rel_path.replace(os.sep, '/')] = asset
+            total += sum(len(v) for v in asset.variants.values())
+        logger.info(f"Cached {len(self.assets)} static files ({total // 1024} KiB with compressed variants)")
+
+    def _pick_encoding(self, asset):
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and accepted[encoding] > 0:
+                return encoding
+        return ''
+
+    def send(self, rel_path):
+        """
+        Serve a static file, from memory when cached.
+
+        Args:
+            rel_path (str): Path relative to the static root
+
+        Returns:
+            Response: The file or a 304
+
+        Raises:
+            NotFound: The path isn't a static asset
+        """
+        asset = self.assets.get(rel_path)
+        if asset is None:
+            if ENABLED or not self._allowed(rel_path):
+                abort(404)
+            return send_from_directory(self.root, rel_path)
+
+        encoding = self._pick_encoding(asset)
+        etag = asset.etags[encoding]
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = asset.cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from fact_table import FactTable, answer_question, extract_facts
+
+RECORD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dummy_medical_record.txt')
+TODAY = '2024-03-01'
+
+@pytest.fixture(scope='module')
+def facts():
+    with open(RECORD, 'r', encoding='utf-8') as f:
+        return extract_facts(f.read())
+
+@pytest.fixture(scope='module')
+def table(facts):
+    return FactTable(facts)
+
+def ask(table, message):
+    answer = answer_question(table, message, today=TODAY)
+    return answer.text if answer else None
+
+def test_extracts_medications(facts):
+    assert [(m['name'], m['dose']) for m in facts['medications']] == [
+        ('Lisinopril', '10mg'), ('Metformin', '500mg'), ('Atorvastatin', '20mg'), ('Aspirin', '81mg')]
+    assert 'type 2 diabetes' in facts['medications'][1]['instructions']
+
+def test_extracts_labs(facts):
+    labs = {lab['name']: lab for lab in facts['labs']}
+    assert labs['A1C']['value'] == '6.8'
+    assert labs['Blood Pressure']['value'] == '130/85'
+    assert labs['LDL Cholesterol']['date'] == '2024-02-15'
+
+def test_extracts_diagnoses_allergies_and_appointments(facts):
+    assert [d['name'] for d in facts['diagnoses']] == ['Type 2 Diabetes', 'Hypertension', 'High Cholesterol']
+    # Family history mentions conditions too, but they aren't the patient's
+    assert len(facts['diagnoses']) == 3
+    assert [a['name'] for a in facts['allergies']] == ['Penicillin', 'Sulfa drugs']
+    assert len(facts['appointments']) == 3
+
+def test_lists_medications(table):
+    reply = ask(table, 'What medications am I on?')
+    for name in ('Lisinopril', 'Metformin', 'Atorvastatin', 'Aspirin'):
+        assert name in reply
+
+def test_narrows_medications_to_condition(table):
+    reply = ask(table, 'What meds do I take for diabetes?')
+    assert 'Metformin 500mg' in reply and 'twice daily' in reply
+    assert 'Lisinopril' not in reply and 'Aspirin' not in reply
+
+def test_medication_for_named_condition(table):
+    reply = ask(table, 'What is my blood pressure medication?')
+    assert 'Lisinopril' in reply
+    assert 'Metformin' not in reply and 'Atorvastatin' not in reply and 'Aspirin' not in reply
+
+def test_medication_for_condition_beats_lab_answer(table):
+    reply = ask(table, 'What do I take for my blood pressure?')
+    assert 'Lisinopril' in reply and 'Metformin' not in reply
+
+def test_narrows_medications_by_name(table):
+    reply = ask(table, 'What dose of metformin am I on?')
+    assert 'Metformin 500mg' in reply and 'Aspirin' not in reply
+
+@pytest.mark.parametrize('message', [
+    'How many pills do I take?',                   # a total the record doesn't state
+    'How many pills do I take for diabetes?',
+    'What medications do I take for my knees?',    # nothing listed for it
+    'What is my ibuprofen dose?',
+])
+def test_unanswerable_medication_questions_go_to_llm(table, message):
+    assert ask(table, message) is None
+
+@pytest.mark.parametrize('message', [
+    'I stopped my medications',
+    'I stopped taking my pills last week',
+    'I forgot my meds this morning',
+    'Should I stop taking metformin?',
+    'Is my A1C normal?',
+    'Can I take aspirin with my other medications?',
+])
+def test_advice_and_statements_go_to_llm(table, message):
+    assert ask(table, message) is None
+
+@pytest.mark.parametrize('message', [
+    'Who prescribed my medications?',
+    'Are my medications covered by insurance?',
+    'Do I need blood work before my next appointment?',
+    'Is my next appointment about my diabetes?',
+    'Did my cholesterol go down since last time?',     # trends and history need more than the latest value
+    'How has my A1C changed over the years?',
+    'What was my cholesterol in 2023?',
+])
+def test_questions_that_only_mention_a_fact_go_to_llm(table, message):
+    assert ask(table, message) is None
+
+def test_latest_labs(table):
+    assert ask(table, 'What was my A1C?') == 'Your most recent results in your record: A1C 6.8% (on 2024-02-15).'
+    reply = ask(table, 'What are my cholesterol numbers?')
+    assert 'LDL Cholesterol 95 mg/dL' in reply and 'Triglycerides 150 mg/dL' in reply
+    assert 'A1C' not in reply
+    assert ask(table, "What's my blood pressure?").startswith('Your most recent results in your record: Blood Pressure')
+
+def test_next_appointment(table):
+    assert ask(table, 'When is my next appointment?').startswith('Your next appointment is on 2024-03-20 at 10:00 AM')
+    answer = answer_question(table, 'When is my next appointment?', today='2024-03-21')
+    assert answer.intent == 'appointment' and '2024-03-25' in answer.text
+
+def test_allergies_and_diagnoses(table):
+    assert ask(table, 'Am I allergic to anything?') == 'Your record lists allergies to: Penicillin, Sulfa drugs.'
+    reply = ask(table, 'What are my diagnoses?')
+    assert '- Type 2 Diabetes (since 2018)' in reply and 'Hypertension' in reply
+
+def test_no_table_or_unrelated_message(table):
+    assert answer_question(None, 'What medications am I on?') is None
+    assert ask(table, 'Hello there!') is None
+    assert ask(table, '') is None
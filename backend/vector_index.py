@@ -0,0 +1,268 @@
+import json
+import os
+import shutil
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Patient data lives outside the repository, which the web server serves static files from
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.expanduser("~"), ".deha", "rag"))
+VECTOR_DIR = os.getenv("RAG_VECTOR_DIR", os.path.join(DATA_DIR, "vector_index"))
+# "int8": one byte per dimension plus a per-vector scale; "float16": two bytes per dimension
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "int8")
+# Candidates pulled from the quantized scan per requested result, re-scored at full precision
+RESCORE_FACTOR = 8
+# Rows dequantized at a time during a scan, bounds the temporary float32 buffer
+SCAN_BLOCK = 8192
+
+class Match:
+    """One query result, shaped like a Pinecone match (id, score, metadata)."""
+
+    __slots__ = ('id', 'score', 'metadata')
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+class QueryResult:
+    def __init__(self, matches, namespace):
+        self.matches = matches
+        self.namespace = namespace
+
+def _matches_filter(metadata, wanted):
+    return all(metadata.get(k) == (v.get('$eq') if isinstance(v, dict) else v) for k, v in wanted.items())
+
+class QuantizedIndex:
+    """
+    Cosine-similarity vectors for one namespace, kept quantized in RAM.
+
+    Quantized codes live in one contiguous array that is scanned for
+    candidates; unit-normalized float32 copies live in a file on disk that
+    is memory-mapped and only touched for the top candidates' re-scoring.
+    """
+
+    def __init__(self, directory, dimension, dtype=VECTOR_DTYPE):
+        if dtype not in ('int8', 'float16'):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.directory = directory
+        self.dimension = dimension
+        self.dtype = dtype
+        self.count = 0
+        self.ids = []
+        self.metadata = []
+        self._rows = {}
+        self._codes = np.empty((0, dimension), dtype=dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._full = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path('meta.json')):
+            return
+        with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['dtype'] != self.dtype or meta['dimension'] != self.dimension:
+            raise ValueError(f"Index in {self.directory} is {meta['dtype']}/{meta['dimension']}, "
+                             f"expected {self.dtype}/{self.dimension}")
+        self.ids = meta['ids']
+        self.metadata = meta['metadata']
+        self.count = len(self.ids)
+        self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        self._codes = np.load(self._path('codes.npy'))
+        self._scales = np.load(self._path('scales.npy'))
+        self._map_full()
+        logger.info(f"Loaded {self.count} {self.dtype} vectors from {self.directory}")
+
+    def _map_full(self):
+        self._full = (np.memmap(self._path('full.f32'), dtype=np.float32, mode='r',
+                                shape=(self.count, self.dimension)) if self.count else None)
+
+    def _save(self):
+        np.save(self._path('codes.npy.tmp.npy'), self._codes[:self.count])
+        os.replace(self._path('codes.npy.tmp.npy'), self._path('codes.npy'))
+        np.save(self._path('scales.npy.tmp.npy'), self._scales[:self.count])
+        os.replace(self._path('scales.npy.tmp.npy'), self._path('scales.npy'))
+        with open(self._path('meta.json.tmp'), 'w', encoding='utf-8') as f:
+            json.dump({'dtype': self.dtype, 'dimension': self.dimension,
+                       'ids': self.ids, 'metadata': self.metadata}, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    def _quantize(self, vectors):
+        if self.dtype == 'float16':
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _reserve(self, needed):
+        if needed <= len(self._codes):
+            return
+        capacity = max(needed, 2 * len(self._codes), 64)
+        codes = np.empty((capacity, self.dimension), dtype=self.dtype)
+        codes[:self.count] = self._codes[:self.count]
+        scales = np.empty(capacity, dtype=np.float32)
+        scales[:self.count] = self._scales[:self.count]
+        self._codes, self._scales = codes, scales
+
+    def upsert(self, vectors):
+        """
+        Insert or overwrite vectors.
+
+        Args:
+            vectors (list): Dicts with id, values (list or array) and metadata
+        """
+        if not vectors:
+            return
+        values = np.asarray([v['values'] for v in vectors], dtype=np.float32).reshape(len(vectors), self.dimension)
+        norms = np.linalg.norm(values, axis=1)
+        norms[norms == 0] = 1.0
+        values /= norms[:, None]
+        codes, scales = self._quantize(values)
+
+        with self._lock:
+            rows = []
+            for vector in vectors:
+                row = self._rows.get(vector['id'])
+                if row is None:
+                    row = len(self.ids)
+                    self._rows[vector['id']] = row
+                    self.ids.append(vector['id'])
+                    self.metadata.append(vector.get('metadata') or {})
+                else:
+                    self.metadata[row] = vector.get('metadata') or {}
+                rows.append(row)
+            new_count = len(self.ids)
+            self._reserve(new_count)
+            self._codes[rows] = codes
+            self._scales[rows] = scales
+
+            # Full-precision rows: grow the file, then write through a writable map
+            self._full = None
+            with open(self._path('full.f32'), 'ab') as f:
+                f.truncate(new_count * self.dimension * 4)
+            full = np.memmap(self._path('full.f32'), dtype=np.float32, mode='r+',
+                             shape=(new_count, self.dimension))
+            full[rows] = values
+            full.flush()
+            del full
+            self.count = new_count
+            self._map_full()
+            self._save()
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True, rescore_factor=RESCORE_FACTOR):
+        """
+        Return the top_k most similar vectors.
+
+        The quantized array is scanned for top_k * rescore_factor candidates,
+        which are then re-ranked by exact float32 cosine similarity.
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dimension)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            count, codes, scales, full = self.count, self._codes, self._scales, self._full
+            metadata = self.metadata
+            ids = self.ids
+        if count == 0:
+            return []
+
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, count)
+            scores[start:end] = codes[start:end].astype(np.float32) @ query
+        scores *= scales[:count]
+        if filter:
+            keep = np.fromiter((_matches_filter(m, filter) for m in metadata[:count]), dtype=bool, count=count)
+            scores[~keep] = -np.inf
+
+        valid = int(np.isfinite(scores).sum())
+        if valid == 0:
+            return []
+        candidates = min(valid, top_k * rescore_factor)
+        if candidates < count:
+            rows = np.argpartition(-scores, candidates - 1)[:candidates]
+        else:
+            rows = np.arange(count)
+        rows = rows[np.isfinite(scores[rows])]
+        rows.sort()  # sequential reads from the memory-mapped file
+
+        exact = np.asarray(full[rows]) @ query
+        order = np.argsort(-exact)[:top_k]
+        return [Match(ids[rows[i]], float(exact[i]), metadata[rows[i]] if include_metadata else None)
+                for i in order]
+
+    def delete(self, ids):
+        """Remove vectors by ID, compacting the arrays and the full-precision file."""
+        with self._lock:
+            drop = {self._rows[i] for i in ids if i in self._rows}
+            if not drop:
+                return
+            keep = [row for row in range(self.count) if row not in drop]
+            full = np.array(self._full[keep]) if keep else None
+            self._codes = self._codes[keep]
+            self._scales = self._scales[keep]
+            self.ids = [self.ids[row] for row in keep]
+            self.metadata = [self.metadata[row] for row in keep]
+            self._rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+            self.count = len(keep)
+            self._full = None
+            if full is not None:
+                full.tofile(self._path('full.f32.tmp'))
+                os.replace(self._path('full.f32.tmp'), self._path('full.f32'))
+            else:
+                open(self._path('full.f32'), 'wb').close()
+            self._map_full()
+            self._save()
+
+    def memory_bytes(self):
+        """Bytes held in RAM for scanning (codes and scales, not the mapped file)."""
+        return int(self._codes[:self.count].nbytes + self._scales[:self.count].nbytes)
+
+class LocalVectorIndex:
+    """
+    Drop-in for the subset of the Pinecone Index API rag.py uses
+    (upsert, query, delete), backed by one QuantizedIndex per namespace.
+    """
+
+    def __init__(self, directory=VECTOR_DIR, dimension=4096, dtype=VECTOR_DTYPE):
+        self.directory = directory
+        self.dimension = dimension
+        self.dtype = dtype
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace):
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                index = QuantizedIndex(os.path.join(self.directory, namespace or '_default'),
+                                       self.dimension, self.dtype)
+                self._namespaces[namespace] = index
+            return index
+
+    def upsert(self, vectors, namespace=''):
+        self._namespace(namespace).upsert(vectors)
+        return {'upserted_count': len(vectors)}
+
+    def query(self, vector, top_k=10, namespace='', filter=None, include_metadata=False, **kwargs):
+        matches = self._namespace(namespace).query(vector, top_k=top_k, filter=filter,
+                                                   include_metadata=include_metadata)
+        return QueryResult(matches, namespace)
+
+    def delete(self, ids=None, delete_all=False, namespace=''):
+        if delete_all:
+            with self._lock:
+                self._namespaces.pop(namespace, None)
+            shutil.rmtree(os.path.join(self.directory, namespace or '_default'), ignore_errors=True)
+        elif ids:
+            self._namespace(namespace).delete(ids)
+        return {}
@@ -0,0 +1,247 @@
+"""
+Full-duplex voice channel over a WebSocket at /voice/ws.
+
+Client -> server:
+  - binary frames: 16 kHz mono 16-bit little-endian PCM from the microphone
+    (capture with echoCancellation on so playback isn't heard as barge-in)
+  - text frames: JSON control messages
+      {"type": "start", "session_id": "...", "silence_duration": 1.0}
+      {"type": "cancel"}   stop the current answer
+      {"type": "stop"}     close the channel
+
+Server -> client:
+  - text frames: JSON events
+      ready, speech_start, barge_in, transcript, token, response_end,
+      audio_end, no_speech, error
+  - binary frames: MP3 audio of the answer, streamed sentence by sentence
+"""
+import json
+import queue
+import re
+import threading
+import logging
+from flask_sock import Sock
+
+from audio import SpeechSegmenter, SILENCE_DURATION, pcm_to_wav, stream_speech, transcribe_audio_bytes
+from model_router import route_query
+from scheduler import PRIORITY_VOICE
+from session_store import sessions
+
+logger = logging.getLogger(__name__)
+
+# Consecutive 20ms speech frames needed before we treat it as the user talking
+BARGE_IN_SPEECH_FRAMES = 5
+# Flush text to TTS at a sentence boundary once at least this many characters are buffered
+MIN_TTS_CHARS = 40
+SENTENCE_END = re.compile(r'[.!?]["\')\]]?\s')
+
+def _split_sentence(buffer):
+    """Split buffered LLM text at the last sentence end, if enough has built up."""
+    last = None
+    for last in SENTENCE_END.finditer(buffer):
+        pass
+    if last is not None and last.end() >= MIN_TTS_CHARS:
+        return buffer[:last.end()].strip(), buffer[last.end():]
+    return None, buffer
+
+class VoiceChannel:
+    """One connected client: VAD on incoming audio, one answer turn at a time."""
+
+    def __init__(self, ws, stream_completion, current_prefix, prefix_for, instant_answer):
+        self.ws = ws
+        self.stream_completion = stream_completion
+        self.current_prefix = current_prefix
+        self.prefix_for = prefix_for
+        self.instant_answer = instant_answer
+        self.session_id = sessions.new_session_id()
+        self.silence_duration = SILENCE_DURATION
+        self.send_lock = threading.Lock()
+        self.closed = False
+        self.turn_cancel = None
+        self.turn_thread = None
+
+    def send_event(self, event_type, **payload):
+        self._send(json.dumps({'type': event_type, **payload}))
+
+    def _send(self, data):
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.ws.send(data)
+        except Exception as e:
+            logger.info(f"Voice channel closed while sending: {str(e)}")
+            self.closed = True
+            self.cancel_turn()
+
+    def cancel_turn(self):
+        """Stop the in-flight answer (LLM stream and TTS), if any."""
+        if self.turn_cancel is not None and not self.turn_cancel.is_set():
+            self.turn_cancel.set()
+            return True
+        return False
+
+    def run(self):
+        segmenter = None
+        try:
+            while not self.closed:
+                message = self.ws.receive()
+                if message is None:
+                    break
+                if isinstance(message, str):
+                    control = json.loads(message)
+                    if control.get('type') == 'start':
+                        self.session_id = control.get('session_id') or self.session_id
+                        self.silence_duration = float(control.get('silence_duration', SILENCE_DURATION))
+                        segmenter = None
+                        self.send_event('ready', session_id=self.session_id)
+                    elif control.get('type') == 'cancel':
+                        self.cancel_turn()
+                    elif control.get('type') == 'stop':
+                        break
+                    continue
+
+                if segmenter is None:
+                    segmenter = SpeechSegmenter(silence_duration=self.silence_duration,
+                                                min_speech_frames=BARGE_IN_SPEECH_FRAMES)
+                for event, pcm in segmenter.feed(message):
+                    if event == 'speech_start':
+                        if self.cancel_turn():
+                            self.send_event('barge_in')
+                        self.send_event('speech_start')
+                    else:
+                        self.start_turn(pcm)
+        except Exception as e:
+            logger.error(f"Error in voice channel: {str(e)}", exc_info=True)
+            self.send_event('error', message='Sorry, I encountered an error while processing your request.')
+        finally:
+            self.closed = True
+            self.cancel_turn()
+
+    def start_turn(self, pcm):
+        self.cancel_turn()
+        cancel = threading.Event()
+        self.turn_cancel = cancel
+        self.turn_thread = threading.Thread(target=self._run_turn, args=(pcm, cancel),
+                                            name='voice-turn', daemon=True)
+        self.turn_thread.start()
+
+    def _run_turn(self, pcm, cancel):
+        try:
+            if self.current_prefix() is None:
+                self.send_event('error', message='Please upload a PDF first.')
+                return
+
+            transcript = (transcribe_audio_bytes(pcm_to_wav(pcm)) or '').strip()
+            if cancel.is_set():
+                return
+            if len(transcript) < 2:
+                self.send_event('no_speech')
+                return
+            self.send_event('transcript', text=transcript)
+
+            sentences = queue.Queue()
+            speaker = threading.Thread(target=self._speak, args=(sentences, cancel),
+                                       name='voice-tts', daemon=True)
+            speaker.start()
+
+            parts = []
+            try:
+                # Same fast paths and prompt prefix as /chat, /voice and /listen
+                answer = self.instant_answer(self.session_id, transcript)
+                if answer is not None:
+                    parts.append(answer)
+                    self.send_event('token', text=answer)
+                    sentences.put(answer)
+                else:
+                    self._stream_answer(transcript, cancel, parts, sentences)
+            finally:
+                # Always release the TTS thread, even if the completion failed
+                sentences.put(None)
+
+            ai_response = ''.join(parts).strip()
+            interrupted = cancel.is_set()
+            self.send_event('response_end', text=ai_response, interrupted=interrupted)
+            if ai_response:
+                sessions.record_turn(self.session_id, transcript, ai_response)
+
+            speaker.join()
+            if not cancel.is_set():
+                self.send_event('audio_end')
+        except Exception as e:
+            logger.error(f"Error in voice turn: {str(e)}", exc_info=True)
+            self.send_event('error', message='Sorry, I encountered an error while processing your request.')
+
+    def _stream_answer(self, transcript, cancel, parts, sentences):
+        """Stream a completion, sending tokens and queueing whole sentences for TTS."""
+        route = route_query(transcript)
+        prefix = self.prefix_for(self.session_id, route)
+        messages = sessions.build_messages(self.session_id, prefix.text, transcript)
+        buffer = ''
+        stream = self.stream_completion(
+            priority=PRIORITY_VOICE,
+            model=route.model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=route.max_tokens,
+        )
+        try:
+            for chunk in stream:
+                if cancel.is_set():
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                self.send_event('token', text=delta)
+                sentence, buffer = _split_sentence(buffer + delta)
+                if sentence:
+                    sentences.put(sentence)
+        finally:
+            # Closing the stream aborts the upstream generation on barge-in
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+
+        if buffer.strip() and not cancel.is_set():
+            sentences.put(buffer.strip())
+
+    def _speak(self, sentences, cancel):
+        """Synthesize queued sentences in order and stream the audio to the client."""
+        while True:
+            sentence = sentences.get()
+            if sentence is None or cancel.is_set():
+                return
+            chunks = stream_speech(sentence, priority=PRIORITY_VOICE)
+            try:
+                for chunk in chunks:
+                    if cancel.is_set():
+                        return
+                    self._send(chunk)
+            except Exception as e:
+                logger.error(f"Error streaming TTS: {str(e)}")
+                return
+            finally:
+                chunks.close()
+
+def init_voice_socket(app, stream_completion, current_prefix, prefix_for, instant_answer):
+    """
+    Register the /voice/ws WebSocket route.
+
+    Args:
+        app (Flask): The application
+        stream_completion (callable): Starts a streaming chat completion from keyword args
+        current_prefix (callable): Returns the PromptPrefix for the loaded record, or None
+        prefix_for (callable): (session_id, route) -> the PromptPrefix for a turn
+        instant_answer (callable): (session_id, message) -> a reply that needs no completion, or None
+
+    Returns:
+        Sock: The flask-sock extension instance
+    """
+    sock = Sock(app)
+
+    @sock.route('/voice/ws')
+    def voice_socket(ws):
+        VoiceChannel(ws, stream_completion, current_prefix, prefix_for, instant_answer).run()
+
+    return sock
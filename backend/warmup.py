@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+from audio import synthesize_speech
+from fact_table import fact_tables, answer_question
+from metrics import cache_requests, span
+from model_router import route_query, LARGE_MODEL
+from prompts import SUMMARY_PROMPT, get_prefix, summary_prefix
+from scheduler import scheduler, PRIORITY_BACKGROUND
+from single_flight import request_key
+
+logger = logging.getLogger(__name__)
+
+# Off by default: warm-up spends LLM tokens and TTS characters on every upload
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "0") == "1"
+GREETING = os.getenv("WARMUP_GREETING",
+                     "Hi, I'm Deha AI. I've gone through your medical record. What would you like to know?")
+# "|"-separated list of questions answered ahead of time
+COMMON_QUESTIONS = [q.strip() for q in os.getenv(
+    "WARMUP_QUESTIONS",
+    "What medications am I on?|What were my last lab results?|When is my next appointment?"
+    "|What are my diagnoses?|What should I focus on for my health?"
+).split('|') if q.strip()]
+
+SUMMARY_MAX_TOKENS = 400
+ANSWER_MAX_TOKENS = 300
+MAX_AUDIO_BYTES = 32 * 1024 * 1024   # Pre-synthesized audio kept in memory
+IDLE_POLL = 0.5                      # Seconds between checks for idle upstream capacity
+MAX_IDLE_WAIT = 30.0                 # Give up waiting for idle and queue at low priority anyway
+
+def normalize_question(text):
+    """Lowercase, drop punctuation and collapse whitespace so near-identical questions match."""
+    return ' '.join(re.sub(r'[^a-z0-9 ]', ' ', (text or '').lower()).split())
+
+class Warmup:
+    """
+    Post-upload precomputation, run on a background thread at low priority.
+
+    For each uploaded record it builds a compact summary prefix, answers
+    COMMON_QUESTIONS, and pre-synthesizes the greeting and those answers.
+    A newer upload supersedes the one being warmed.
+    """
+
+    def __init__(self, create_completion, enabled=WARMUP_ENABLED, questions=COMMON_QUESTIONS,
+                 greeting=GREETING):
+        self.create_completion = create_completion
+        self.enabled = enabled
+        self.questions = questions
+        self.greeting = greeting
+        self._summaries = {}
+        self._answers = {}
+        self._audio = OrderedDict()
+        self._audio_bytes = 0
+        self._current = None
+        self._lock = threading.Lock()
+
+    def start(self, record_text, doc_version):
+        """Warm caches for a newly uploaded record in the background (no-op when disabled)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._current = doc_version
+            # Only the latest record is served; drop what was warmed for older ones
+            self._summaries = {v: s for v, s in self._summaries.items() if v == doc_version}
+            self._answers = {k: a for k, a in self._answers.items() if k[0] == doc_version}
+        thread = threading.Thread(target=self._run, args=(record_text, doc_version),
+                                  name=f'warmup-{doc_version[:8]}', daemon=True)
+        thread.start()
+        return thread
+
+    def _superseded(self, doc_version):
+        return self._current != doc_version
+
+    def _wait_for_idle(self, provider):
+        # Start each step only once interactive calls have drained from the provider's queue
+        deadline = time.monotonic() + MAX_IDLE_WAIT
+        while scheduler.stats().get(provider, {}).get('queued', 0) and time.monotonic() < deadline:
+            time.sleep(IDLE_POLL)
+
+    def _run(self, record_text, doc_version):
+        started = time.monotonic()
+        try:
+            with span('warmup'):
+                self._speak(self.greeting, doc_version)
+                self._summarize(record_text, doc_version)
+                prefix = get_prefix(record_text, doc_version)
+                for question in self.questions:
+                    if self._superseded(doc_version):
+                        logger.info("Warm-up for %s superseded by a newer upload", doc_version)
+                        return
+                    answer = self._answer(question, prefix, doc_version)
+                    if answer:
+                        self._speak(answer, doc_version)
+            logger.info("Warm-up for %s finished in %.1fs", doc_version, time.monotonic() - started)
+        except Exception as e:
+            logger.error(f"Warm-up for {doc_version} failed: {str(e)}", exc_info=True)
+
+    def _summarize(self, record_text, doc_version):
+        self._wait_for_idle('groq')
+        response = self.create_completion(
+            priority=PRIORITY_BACKGROUND,
+            model=LARGE_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": record_text},
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            stream=False
+        )
+        summary = response.choices[0].message.content.strip()
+        with self._lock:
+            if not self._superseded(doc_version):
+                self._summaries[doc_version] = summary_prefix(summary, doc_version)
+        logger.info("Cached record summary for %s (%d characters)", doc_version, len(summary))
+
+    def _answer(self, question, prefix, doc_version):
+        # Fact-table answers are already instant; only their audio needs warming
+        fact_answer = answer_question(fact_tables.get(doc_version), question)
+        if fact_answer is not None:
+            answer = fact_answer.text
+        else:
+            self._wait_for_idle('groq')
+            route = route_query(question)
+            response = self.create_completion(
+                priority=PRIORITY_BACKGROUND,
+                model=route.model,
+                messages=[
+                    {"role": "system", "content": prefix.text},
+                    {"role": "user", "content": question},
+                ],
+                temperature=0.7,
+                max_tokens=max(route.max_tokens, ANSWER_MAX_TOKENS),
+                stream=False
+            )
+            answer = response.choices[0].message.content.strip()
+        with self._lock:
+            if not self._superseded(doc_version):
+                self._answers[(doc_version, normalize_question(question))] = answer
+        return answer
+
+    def _speak(self, text, doc_version):
+        if self._superseded(doc_version) or self.speech(text, count=False) is not None:
+            return
+        self._wait_for_idle('elevenlabs')
+        audio = synthesize_speech(text, priority=PRIORITY_BACKGROUND)
+        key = request_key('tts', text)
+        with self._lock:
+            self._audio[key] = audio
+            self._audio_bytes += len(audio)
+            while self._audio_bytes > MAX_AUDIO_BYTES and len(self._audio) > 1:
+                _, evicted = self._audio.popitem(last=False)
+                self._audio_bytes -= len(evicted)
+
+    def summary_prefix(self, doc_version):
+        """Return the summary PromptPrefix for a record, or None if not warmed yet."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            prefix = self._summaries.get(doc_version)
+        cache_requests.inc(cache='warmup_summary', result='hit' if prefix else 'miss')
+        return prefix
+
+    def answer(self, doc_version, message):
+        """Return a precomputed answer for a common question, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            answer = self._answers.get((doc_version, normalize_question(message)))
+        cache_requests.inc(cache='warmup_answer', result='hit' if answer else 'miss')
+        return answer
+
+    def speech(self, text, count=True):
+        """Return pre-synthesized audio for exactly this text, or None."""
+        key = request_key('tts', text)
+        with self._lock:
+            audio = self._audio.get(key)
+            if audio is not None:
+                self._audio.move_to_end(key)
+        if count and self.enabled:
+            cache_requests.inc(cache='warmup_audio', result='hit' if audio is not None else 'miss')
+        return audio
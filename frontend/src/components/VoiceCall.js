@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Button, Box, Typography, Paper, CircularProgress } from '@mui/material';
 import MicIcon from '@mui/icons-material/Mic';
 import CallEndIcon from '@mui/icons-material/CallEnd';
@@ -10,6 +10,8 @@ const VoiceCall = () => {
     const [error, setError] = useState(null);
     const [transcript, setTranscript] = useState('');
     const [aiResponse, setAiResponse] = useState('');
+    // Conversation memory on the server is keyed by this; one session per call
+    const sessionIdRef = useRef(null);
     const theme = useTheme();
 
     useEffect(() => {
@@ -20,6 +22,25 @@ const VoiceCall = () => {
         };
     }, []);
 
+    const postListen = async () => {
+        const formData = new FormData();
+        if (sessionIdRef.current) {
+            formData.append('session_id', sessionIdRef.current);
+        }
+        const response = await fetch('http://localhost:5000/listen', {
+            method: 'POST',
+            headers: {
+                'Accept': 'audio/mpeg',
+            },
+            body: formData,
+        });
+        const sessionId = response.headers.get('X-Session-Id');
+        if (sessionId) {
+            sessionIdRef.current = sessionId;
+        }
+        return response;
+    };
+
     const startCall = async () => {
         if (isCallActive) return;
         
@@ -29,12 +50,7 @@ const VoiceCall = () => {
             setIsCallActive(true);
             setIsProcessing(true);
             
-            const response = await fetch('http://localhost:5000/listen', {
-                method: 'POST',
-                headers: {
-                    'Accept': 'audio/mpeg',
-                },
-            });
+            const response = await postListen();
 
             console.log('Response status:', response.status);
             
@@ -84,12 +100,7 @@ const VoiceCall = () => {
             setError(null);
             console.log('Sending request to /listen endpoint');
             
-            const response = await fetch('http://localhost:5000/listen', {
-                method: 'POST',
-                headers: {
-                    'Accept': 'audio/mpeg',
-                },
-            });
+            const response = await postListen();
 
             console.log('Response status:', response.status);
             
@@ -143,6 +154,7 @@ const VoiceCall = () => {
         setError(null);
         setTranscript('');
         setAiResponse('');
+        sessionIdRef.current = null;
     };
 
     return (
@@ -35,6 +35,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const API_BASE_URL = 'http://127.0.0.1:5000';
     console.log('Using API base URL:', API_BASE_URL);
 
+    // Conversation session, assigned by the server on the first chat reply
+    let sessionId = null;
+
     // Test server connection
     console.log('Testing server connection...');
     fetch(`${API_BASE_URL}/test`)
@@ -155,10 +158,13 @@ document.addEventListener('DOMContentLoaded', () => {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ message })
+            body: JSON.stringify({ message, session_id: sessionId })
         })
         .then(response => response.json())
         .then(data => {
+            if (data.session_id) {
+                sessionId = data.session_id;
+            }
             addMessage('AI', data.response);
         })
         .catch(error => {